@@ -1,8 +1,25 @@
+import argparse
+import csv
+import json
 import math
+import os
 import random
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+from functools import partial
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
+from OpenGL.GL import shaders
+from OpenGL.arrays import vbo
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # GLOBAL
@@ -13,6 +30,15 @@ game_state = GAME_PLAYING
 score, difficulty = 0, 0
 health_booster_pos = {'x': 0, 'y': 0, 'pulse': 0.0, 'radius': 25.0}
 
+# Fixed timestep: idle() runs SIM_HZ ticks per second of wall time no matter how
+# fast frames render, and drawing interpolates between the last two ticks.
+SIM_HZ = 60.0
+MAX_TICKS_PER_IDLE = 5          # beyond this the sim slows down instead of spiralling
+sim_accumulator, last_idle_time = 0.0, None
+sim_tick = 0
+render_alpha = 1.0
+redraw_pending = True
+
 
 #  PLAYER
 
@@ -52,6 +78,7 @@ burst_remaining = 0
 
 laser_beam_active, laser_target_pos = False, (0, 0, 0)
 bullets, bullet_speed = [], 15.0
+BULLET_NORMAL, BULLET_BURST, BULLET_SHOCKWAVE = range(3)
 
 
 # ENEMY
@@ -67,6 +94,10 @@ ENEMY_STATS = {
     3: {"hp": 50,  "speed": 0.0, "stop_dist": 0,     "fire_rate": 360, "bullet_speed": 20,"bullet_damage": 75, "radius": 20, "contact_damage": 0, "kamikaze_damage": 0},
     4: {"hp": 50,  "speed": 2.5, "stop_dist": 5,     "fire_rate": 9999,"bullet_speed": 0, "bullet_damage": 0,  "radius": 25, "contact_damage": 0, "kamikaze_damage": 150},
 }
+ENEMY_KILL_SCORE = {0: 5, 1: 30, 2: 15, 3: 5, 4: 10}
+# per difficulty level, spawned enemies gain 15% hp and 8% speed, split-off minions 10% and 5%
+DIFFICULTY_HP_SCALE, DIFFICULTY_SPEED_SCALE = 0.15, 0.08
+SPLIT_HP_SCALE, SPLIT_SPEED_SCALE = 0.1, 0.05
 GRID_LENGTH, fovY = 1800, 90
 
 
@@ -75,6 +106,15 @@ pond_data = {'x': 250, 'y': 200, 'radius': 90}
 TREE_RADIUS, POND_RADIUS = 15.0, pond_data['radius']
 
 
+# SPATIAL GRID
+
+CELL_SIZE = 100.0
+tree_grid = {}      # static, rebuilt by index_scenery
+enemy_grid = {}     # dynamic, rebuilt every tick (stores indices into enemies)
+MAX_ENEMY_RADIUS = max(s['radius'] for s in ENEMY_STATS.values())
+BROADPHASE_MARGIN = 20.0
+
+
 # Math 
 def sin_approx(x):
     while x > 3.14159: x -= 6.28318
@@ -82,7 +122,154 @@ def sin_approx(x):
     x2 = x * x
     return x - x*x2/6.0 + x*x2*x2/120.0
 
-def draw_text(x, y, text, font=GLUT_BITMAP_HELVETICA_18):
+def cell_of(x, y):
+    return math.floor(x / CELL_SIZE), math.floor(y / CELL_SIZE)
+
+def grid_insert(grid, x, y, item):
+    key = cell_of(x, y)
+    bucket = grid.get(key)
+    if bucket is None:
+        grid[key] = [item]
+    else:
+        bucket.append(item)
+
+def grid_query(grid, min_x, min_y, max_x, max_y):
+    cx0, cy0 = cell_of(min_x, min_y)
+    cx1, cy1 = cell_of(max_x, max_y)
+    for cx in range(cx0, cx1 + 1):
+        for cy in range(cy0, cy1 + 1):
+            bucket = grid.get((cx, cy))
+            if bucket:
+                yield from bucket
+
+def build_tree_grid():
+    tree_grid.clear()
+    for tree in tree_positions:
+        grid_insert(tree_grid, tree[0], tree[1], tree)
+
+def rebuild_enemy_grid():
+    enemy_grid.clear()
+    if soa_backend:
+        # straight from the position columns, no row lists
+        for i, (x, y) in enumerate(zip(memoryview(enemies.column(0)), memoryview(enemies.column(1)))):
+            grid_insert(enemy_grid, x, y, i)
+    else:
+        for i, e in enumerate(enemies):
+            grid_insert(enemy_grid, e[0], e[1], i)
+
+def trees_near(x, y, reach):
+    # every tree whose center may lie within `reach` of (x, y)
+    return grid_query(tree_grid, x - reach, y - reach, x + reach, y + reach)
+
+def enemies_near(x, y, reach):
+    # indices in list order, so "first hit" matches a linear scan
+    reach += MAX_ENEMY_RADIUS
+    return sorted(grid_query(enemy_grid, x - reach, y - reach, x + reach, y + reach))
+
+def enemies_along(p1x, p1y, p2x, p2y):
+    # indices in list order of every enemy whose circle may touch the segment
+    reach = MAX_ENEMY_RADIUS
+    return sorted(grid_query(enemy_grid, min(p1x, p2x) - reach, min(p1y, p2y) - reach,
+                             max(p1x, p2x) + reach, max(p1y, p2y) + reach))
+
+# TEXT
+# The GLUT bitmap fonts are rasterized once into an alpha texture (on the first
+# frame, into the back buffer before it is cleared). draw_text only queues a
+# string; flush_text() draws everything queued this frame as one batch of
+# textured quads, reusing the vertex data of strings that did not change.
+
+ATLAS_FONTS = (GLUT_BITMAP_HELVETICA_18, GLUT_BITMAP_8_BY_13)
+ATLAS_WIDTH, ATLAS_HEIGHT = 512, 256
+GLYPH_PAD = 2
+glyph_atlas = None      # None until the first frame, False when unavailable
+text_queue = []         # (key, font) per draw_text call this frame
+text_cache = {}         # key -> (vertices, texcoords, colors) of the strings drawn last frame
+text_batch = ([], None) # keys and concatenated arrays of the last flushed frame
+
+def init_glyph_atlas():
+    global glyph_atlas
+    glyph_atlas = False
+    if np is None or not bool(glutBitmapCharacter):
+        return
+    clear_color = glGetFloatv(GL_COLOR_CLEAR_VALUE)
+    glViewport(0, 0, 1000, 800)
+    glMatrixMode(GL_PROJECTION)
+    glPushMatrix()
+    glLoadIdentity()
+    gluOrtho2D(0, 1000, 0, 800)
+    glMatrixMode(GL_MODELVIEW)
+    glPushMatrix()
+    glLoadIdentity()
+    glClearColor(0, 0, 0, 1)
+    glClear(GL_COLOR_BUFFER_BIT)
+    glColor3f(1, 1, 1)
+    
+    # glyph -> quad corners relative to the pen position, atlas uv, advance
+    glyphs = {}
+    y = 0
+    for font in ATLAS_FONTS:
+        line = glutBitmapHeight(font) + 2 * GLYPH_PAD
+        descent = glutBitmapHeight(font) // 4
+        x = 0
+        for code in range(32, 127):
+            advance = glutBitmapWidth(font, code)
+            w = advance + 2 * GLYPH_PAD
+            if x + w > ATLAS_WIDTH:
+                x, y = 0, y + line
+            glRasterPos2i(x + GLYPH_PAD, y + GLYPH_PAD + descent)
+            glutBitmapCharacter(font, code)
+            left, bottom = -GLYPH_PAD, -GLYPH_PAD - descent
+            glyphs[(font.value, chr(code))] = (left, bottom, left + w, bottom + line,
+                                               x / ATLAS_WIDTH, y / ATLAS_HEIGHT, (x + w) / ATLAS_WIDTH, (y + line) / ATLAS_HEIGHT,
+                                               advance)
+            x += w
+        y += line
+    
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    pixels = glReadPixels(0, 0, ATLAS_WIDTH, ATLAS_HEIGHT, GL_RED, GL_UNSIGNED_BYTE)
+    glClearColor(*clear_color)
+    glPopMatrix()
+    glMatrixMode(GL_PROJECTION)
+    glPopMatrix()
+    glMatrixMode(GL_MODELVIEW)
+    if y > ATLAS_HEIGHT:
+        return
+    
+    texture = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_ALPHA, ATLAS_WIDTH, ATLAS_HEIGHT, 0, GL_ALPHA, GL_UNSIGNED_BYTE, pixels)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    glyph_atlas = {'texture': texture, 'glyphs': glyphs}
+
+def release_glyph_atlas():
+    global glyph_atlas
+    if glyph_atlas:
+        glDeleteTextures([glyph_atlas['texture']])
+    glyph_atlas = None
+    text_cache.clear()
+
+def text_arrays(x, y, text, font_key, color):
+    vertices, texcoords = [], []
+    for ch in text:
+        glyph = glyph_atlas['glyphs'].get((font_key, ch))
+        if glyph is None:
+            continue
+        x0, y0, x1, y1, u0, v0, u1, v1, advance = glyph
+        vertices += [(x + x0, y + y0), (x + x1, y + y0), (x + x1, y + y1), (x + x0, y + y1)]
+        texcoords += [(u0, v0), (u1, v0), (u1, v1), (u0, v1)]
+        x += advance
+    return (np.array(vertices, dtype=np.float32).reshape(-1, 2),
+            np.array(texcoords, dtype=np.float32).reshape(-1, 2),
+            np.tile(np.array(color, dtype=np.float32), (len(vertices), 1)))
+
+def draw_text(x, y, text, font=GLUT_BITMAP_HELVETICA_18, color=(1.0, 1.0, 1.0)):
+    if glyph_atlas:
+        text_queue.append(((x, y, text, font.value, tuple(color)), font))
+        return
+    glColor3f(*color)
     glMatrixMode(GL_PROJECTION)
     glPushMatrix()
     glLoadIdentity()
@@ -98,6 +285,104 @@ def draw_text(x, y, text, font=GLUT_BITMAP_HELVETICA_18):
     glPopMatrix()
     glMatrixMode(GL_MODELVIEW)
 
+def flush_text():
+    global text_cache, text_batch
+    keys = [key for key, _ in text_queue]
+    text_queue.clear()
+    if keys != text_batch[0]:
+        cache = {}
+        for key in keys:
+            cache[key] = text_cache.get(key) or text_arrays(*key)
+        text_cache = cache
+        text_batch = (keys, [np.concatenate(parts) for parts in zip(*(cache[key] for key in keys))] if keys else None)
+    if not text_batch[1] or not len(text_batch[1][0]):
+        return
+    vertices, texcoords, colors = text_batch[1]
+    
+    glMatrixMode(GL_PROJECTION)
+    glPushMatrix()
+    glLoadIdentity()
+    gluOrtho2D(0, 1000, 0, 800)
+    glMatrixMode(GL_MODELVIEW)
+    glPushMatrix()
+    glLoadIdentity()
+    glEnable(GL_TEXTURE_2D)
+    glBindTexture(GL_TEXTURE_2D, glyph_atlas['texture'])
+    glEnable(GL_ALPHA_TEST)
+    glAlphaFunc(GL_GREATER, 0.5)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+    glEnableClientState(GL_COLOR_ARRAY)
+    glVertexPointer(2, GL_FLOAT, 0, vertices)
+    glTexCoordPointer(2, GL_FLOAT, 0, texcoords)
+    glColorPointer(3, GL_FLOAT, 0, colors)
+    glDrawArrays(GL_QUADS, 0, len(vertices))
+    glDisableClientState(GL_COLOR_ARRAY)
+    glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glDisable(GL_ALPHA_TEST)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    glDisable(GL_TEXTURE_2D)
+    glPopMatrix()
+    glMatrixMode(GL_PROJECTION)
+    glPopMatrix()
+    glMatrixMode(GL_MODELVIEW)
+
+# LINE OF SIGHT
+# Trees go into every cell their blocking disc overlaps, so a segment only has to
+# test the trees in the cells it passes through (grid DDA), stopping at the first
+# blocker. Enemy -> player checks also cache, per pair of fine cells, the few trees
+# that could block any segment between the two cells; the exact test then runs
+# against just those, so cached answers never differ from a full check.
+
+LOS_REACH = TREE_RADIUS + 5     # a tree blocks segments passing closer than this to its centre
+LOS_CACHE_CELL = 25.0
+los_grid = {}                   # static, rebuilt by index_scenery
+los_cache = {}                  # enemy fine cell -> candidate blockers, for los_cache_player_cell
+los_cache_player_cell = None
+
+def build_los_grid():
+    global los_cache_player_cell
+    los_grid.clear()
+    for tree in tree_positions:
+        cx0, cy0 = cell_of(tree[0] - LOS_REACH, tree[1] - LOS_REACH)
+        cx1, cy1 = cell_of(tree[0] + LOS_REACH, tree[1] + LOS_REACH)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                los_grid.setdefault((cx, cy), []).append(tree)
+    los_cache.clear()
+    los_cache_player_cell = None
+
+def segment_cells(p1x, p1y, p2x, p2y):
+    # grid DDA: the cells the segment passes through, in order from p1 to p2
+    cx, cy = cell_of(p1x, p1y)
+    end_x, end_y = cell_of(p2x, p2y)
+    dx, dy = p2x - p1x, p2y - p1y
+    step_x = 1 if dx > 0 else -1
+    step_y = 1 if dy > 0 else -1
+    # t (0..1 along the segment) of the next vertical / horizontal cell border
+    t_x = ((cx + (step_x > 0)) * CELL_SIZE - p1x) / dx if dx else math.inf
+    t_y = ((cy + (step_y > 0)) * CELL_SIZE - p1y) / dy if dy else math.inf
+    dt_x = CELL_SIZE / abs(dx) if dx else math.inf
+    dt_y = CELL_SIZE / abs(dy) if dy else math.inf
+    yield cx, cy
+    while (cx, cy) != (end_x, end_y):
+        if cx != end_x and (cy == end_y or t_x < t_y):
+            cx += step_x
+            t_x += dt_x
+        else:
+            cy += step_y
+            t_y += dt_y
+        yield cx, cy
+
+def segment_blocked_by(p1x, p1y, dx, dy, line_len_sq, trees):
+    for tx, ty, _ in trees:
+        t = max(0, min(1, ((tx - p1x) * dx + (ty - p1y) * dy) / line_len_sq))
+        closest_x, closest_y = p1x + t * dx, p1y + t * dy
+        if (tx - closest_x)**2 + (ty - closest_y)**2 < LOS_REACH**2:
+            return True
+    return False
+
 def check_line_of_sight(start_pos, end_pos):
     p1x, p1y = start_pos
     p2x, p2y = end_pos
@@ -105,24 +390,939 @@ def check_line_of_sight(start_pos, end_pos):
     line_len_sq = dx*dx + dy*dy
     if line_len_sq == 0:
         return True
+    for cell in segment_cells(p1x, p1y, p2x, p2y):
+        trees = los_grid.get(cell)
+        if trees and segment_blocked_by(p1x, p1y, dx, dy, line_len_sq, trees):
+            return False
+    return True
+
+def los_cell(x, y):
+    return math.floor(x / LOS_CACHE_CELL), math.floor(y / LOS_CACHE_CELL)
+
+def cell_pair_blockers(cell_a, cell_b):
+    # trees within reach of the hull of both cells: the segment between their
+    # centres, widened by half a cell diagonal (+1 for rounding)
+    ax, ay = (cell_a[0] + 0.5) * LOS_CACHE_CELL, (cell_a[1] + 0.5) * LOS_CACHE_CELL
+    bx, by = (cell_b[0] + 0.5) * LOS_CACHE_CELL, (cell_b[1] + 0.5) * LOS_CACHE_CELL
+    reach = LOS_REACH + LOS_CACHE_CELL * 0.7072 + 1.0
+    dx, dy = bx - ax, by - ay
+    line_len_sq = dx*dx + dy*dy
+    blockers = []
+    for tree in grid_query(tree_grid, min(ax, bx) - reach, min(ay, by) - reach, max(ax, bx) + reach, max(ay, by) + reach):
+        t = max(0, min(1, ((tree[0] - ax) * dx + (tree[1] - ay) * dy) / line_len_sq)) if line_len_sq else 0
+        if (tree[0] - ax - t * dx)**2 + (tree[1] - ay - t * dy)**2 < reach**2:
+            blockers.append(tree)
+    return blockers
+
+def enemy_sees_player(x, y):
+    global los_cache_player_cell
+    player_cell = los_cell(player_x, player_y)
+    if player_cell != los_cache_player_cell:
+        los_cache.clear()
+        los_cache_player_cell = player_cell
+    cell = los_cell(x, y)
+    blockers = los_cache.get(cell)
+    if blockers is None:
+        blockers = los_cache[cell] = cell_pair_blockers(cell, player_cell)
+    dx, dy = player_x - x, player_y - y
+    line_len_sq = dx*dx + dy*dy
+    return line_len_sq == 0 or not segment_blocked_by(x, y, dx, dy, line_len_sq, blockers)
+
+# SWEPT COLLISION
+# Projectiles test the whole step they travel in a tick against enemy, player and
+# tree circles and stop at the earliest contact, so a fast shot cannot jump over
+# a target between two ticks. t is the fraction of the step, 0..1.
+
+def segment_circle_t(p1x, p1y, dx, dy, cx, cy, radius):
+    # t where the segment first enters the circle, 0 if it starts inside, None if it misses
+    fx, fy = p1x - cx, p1y - cy
+    c = fx*fx + fy*fy - radius*radius
+    if c < 0:
+        return 0.0
+    a = dx*dx + dy*dy
+    b = fx*dx + fy*dy
+    if a == 0 or b >= 0:
+        return None
+    disc = b*b - a*c
+    if disc <= 0:
+        return None
+    t = (-b - math.sqrt(disc)) / a
+    return t if t <= 1 else None
+
+def segment_tree_t(p1x, p1y, p2x, p2y):
+    # earliest t at which the segment comes within LOS_REACH of a tree
+    dx, dy = p2x - p1x, p2y - p1y
+    best = None
+    for cell in segment_cells(p1x, p1y, p2x, p2y):
+        for tx, ty, _ in los_grid.get(cell, ()):
+            t = segment_circle_t(p1x, p1y, dx, dy, tx, ty, LOS_REACH)
+            if t is not None and (best is None or t < best):
+                best = t
+    return best
+
+def first_enemy_on_segment(p1x, p1y, p2x, p2y):
+    # (t, index) of the first enemy the segment enters, lowest index on ties
+    dx, dy = p2x - p1x, p2y - p1y
+    best = None
+    for i in enemies_along(p1x, p1y, p2x, p2y):
+        e = enemies[i]
+        t = segment_circle_t(p1x, p1y, dx, dy, e[0], e[1], ENEMY_STATS[e[3]]['radius'])
+        if t is not None and (best is None or t < best[0]):
+            best = (t, i)
+    return best
+
+# FLOW FIELD
+# Enemies steer along a shared shortest-path field toward the player instead of
+# probing greedily. The arena is rasterized into FLOW_CELL cells, blocked where a
+# cell centre is within the class radius + TREE_RADIUS of a tree, with one raster
+# and neighbour table per radius class, built with the scenery. A Dijkstra pass
+# from the player's cell (bucket queue, integer step costs 5 straight / 7
+# diagonal) gives every cell the neighbour to head for next. When the player
+# changes cell the new field is built FLOW_BUDGET expanded cells per tick while
+# enemies keep steering on the last finished one (the greedy probes until the
+# first is done), so no tick pays for a whole pass. Finished fields stay cached,
+# most recently used first to go, so walking back and forth costs nothing.
+
+FLOW_CELL = 50.0
+FLOW_SIZE = int(2 * GRID_LENGTH / FLOW_CELL)
+FLOW_CLASSES = (25.0, MAX_ENEMY_RADIUS)     # enemies use the smallest class that fits them
+FLOW_CACHE = 16                             # fields kept across all classes
+FLOW_BUDGET = 512                           # cells expanded per class per tick
+FLOW_STEPS = ((1, 0, 5), (-1, 0, 5), (0, 1, 5), (0, -1, 5), (1, 1, 7), (1, -1, 7), (-1, 1, 7), (-1, -1, 7))
+flow_tables = {}        # class radius -> (blocked per cell, per cell the [(cell, cost)] that may step into it)
+flow_fields = {}        # (class radius, goal cell) -> next cell per cell, -1 at the goal / unreachable
+flow_active = {}        # class radius -> (goal cell, field) the enemies steer on
+flow_builds = {}        # class radius -> (goal cell, build generator, ticks spent) of the field under way
+
+def reset_flow_fields():
+    flow_tables.clear()
+    clear_flow_fields()
+    for r in FLOW_CLASSES:
+        flow_table(r)
+
+def clear_flow_fields():
+    flow_fields.clear()
+    flow_active.clear()
+    flow_builds.clear()
+
+def flow_class(radius):
+    for r in FLOW_CLASSES:
+        if radius <= r:
+            return r
+    return FLOW_CLASSES[-1]
+
+def flow_cell(x, y):
+    cx = min(FLOW_SIZE - 1, max(0, int((x + GRID_LENGTH) // FLOW_CELL)))
+    cy = min(FLOW_SIZE - 1, max(0, int((y + GRID_LENGTH) // FLOW_CELL)))
+    return cx * FLOW_SIZE + cy
+
+def flow_cell_center(cell):
+    cx, cy = divmod(cell, FLOW_SIZE)
+    return (cx + 0.5) * FLOW_CELL - GRID_LENGTH, (cy + 0.5) * FLOW_CELL - GRID_LENGTH
+
+def flow_blocked(radius):
+    # not is_position_valid_for_enemy_static at every cell centre, stamped tree by tree
+    blocked = []
+    for cell in range(FLOW_SIZE * FLOW_SIZE):
+        x, y = flow_cell_center(cell)
+        blocked.append(not (-GRID_LENGTH + radius < x < GRID_LENGTH - radius and -GRID_LENGTH + radius < y < GRID_LENGTH - radius))
+    reach = radius + TREE_RADIUS
     for tx, ty, _ in tree_positions:
-        t = max(0, min(1, ((tx - p1x) * dx + (ty - p1y) * dy) / line_len_sq))
-        closest_x, closest_y = p1x + t * dx, p1y + t * dy
-        if (tx - closest_x)**2 + (ty - closest_y)**2 < (TREE_RADIUS + 5)**2:
+        x0, y0 = flow_cell(tx - reach, ty - reach), flow_cell(tx + reach, ty + reach)
+        for cx in range(x0 // FLOW_SIZE, y0 // FLOW_SIZE + 1):
+            for cy in range(x0 % FLOW_SIZE, y0 % FLOW_SIZE + 1):
+                x, y = flow_cell_center(cx * FLOW_SIZE + cy)
+                if math.hypot(x - tx, y - ty) < reach:
+                    blocked[cx * FLOW_SIZE + cy] = True
+    return blocked
+
+def flow_table(radius):
+    table = flow_tables.get(radius)
+    if table is not None:
+        return table
+    blocked = flow_blocked(radius)
+    entrants = []
+    for cell in range(FLOW_SIZE * FLOW_SIZE):
+        cx, cy = divmod(cell, FLOW_SIZE)
+        steps = []
+        for sx, sy, cost in FLOW_STEPS:
+            nx, ny = cx + sx, cy + sy
+            # no diagonal corner cutting past a blocked cell
+            if 0 <= nx < FLOW_SIZE and 0 <= ny < FLOW_SIZE and not (sx and sy and (blocked[nx * FLOW_SIZE + cy] or blocked[cell + sy])):
+                steps.append((nx * FLOW_SIZE + ny, cost))
+        entrants.append(steps)
+    table = flow_tables[radius] = (blocked, entrants)
+    return table
+
+def build_flow_field(radius, goal):
+    # Generator: Dijkstra outward from the goal, pausing after every FLOW_BUDGET
+    # expanded cells; returns the field. A cell is settled from the neighbour it
+    # should step into. Blocked cells are settled (an enemy whose centre is near
+    # a tree but whose body is clear can still leave) but never expanded.
+    blocked, entrants = flow_table(radius)
+    dist = [-1] * (FLOW_SIZE * FLOW_SIZE)
+    nxt = [-1] * (FLOW_SIZE * FLOW_SIZE)
+    dist[goal] = 0
+    buckets = [[goal]]
+    d = work = 0
+    while d < len(buckets):
+        for cell in buckets[d]:
+            if dist[cell] != d or (blocked[cell] and cell != goal):
+                continue
+            for n, cost in entrants[cell]:
+                nd = d + cost
+                if dist[n] < 0 or nd < dist[n]:
+                    dist[n] = nd
+                    nxt[n] = cell
+                    while len(buckets) <= nd:
+                        buckets.append([])
+                    buckets[nd].append(n)
+            work += 1
+            if work % FLOW_BUDGET == 0:
+                yield
+        d += 1
+    nxt[goal] = -1
+    return np.array(nxt, dtype=np.intp) if soa_backend else nxt
+
+def complete_flow_field(radius, goal, spent=None):
+    # runs a build to the end, or only its first `spent` ticks, leaving it under way
+    build = build_flow_field(radius, goal)
+    try:
+        while spent is None or spent > 0:
+            next(build)
+            spent = None if spent is None else spent - 1
+    except StopIteration as done:
+        return done.value
+    return build
+
+def cache_flow_field(radius, goal, field):
+    # least recently used eviction: a hit moves the field to the end
+    key = (radius, goal)
+    flow_fields.pop(key, None)
+    if len(flow_fields) >= FLOW_CACHE:
+        del flow_fields[next(iter(flow_fields))]
+    flow_fields[key] = field
+    flow_active[radius] = (goal, field)
+
+def advance_flow_fields():
+    # once per tick, before the enemies steer
+    goal = flow_cell(player_x, player_y)
+    for r in FLOW_CLASSES:
+        build = flow_builds.pop(r, None)
+        if build is None:
+            if r in flow_active and flow_active[r][0] == goal:
+                continue
+            if (r, goal) in flow_fields:
+                cache_flow_field(r, goal, flow_fields[(r, goal)])
+                continue
+            build = (goal, build_flow_field(r, goal), 0)
+        pending, steps, spent = build
+        try:
+            next(steps)
+            flow_builds[r] = (pending, steps, spent + 1)
+        except StopIteration as done:
+            cache_flow_field(r, pending, done.value)
+
+def flow_state():
+    # for save_world: per class the goal steered on and the goal and ticks spent
+    # of the build under way (-1 for none), then (class index, goal) of every
+    # cached field, least recently used first
+    state = []
+    for r in FLOW_CLASSES:
+        goal, _ = flow_active.get(r, (-1, None))
+        pending, _, spent = flow_builds.get(r, (-1, None, 0))
+        state += [goal, pending, spent]
+    for r, goal in flow_fields:
+        state += [FLOW_CLASSES.index(r), goal]
+    return state
+
+def restore_flow_state(state):
+    # rebuilds what flow_state() describes, reusing fields already cached
+    cached = dict(flow_fields)
+    clear_flow_fields()
+    def field(key):
+        found = flow_fields.get(key, cached.get(key))
+        return complete_flow_field(*key) if found is None else found
+    n = 3 * len(FLOW_CLASSES)
+    for i in range(n, len(state), 2):
+        key = (FLOW_CLASSES[state[i]], state[i + 1])
+        flow_fields[key] = field(key)
+    for i, r in enumerate(FLOW_CLASSES):
+        goal, pending, spent = state[3 * i:3 * i + 3]
+        if goal >= 0:
+            flow_active[r] = (goal, field((r, goal)))
+        if pending >= 0:
+            flow_builds[r] = (pending, complete_flow_field(r, pending, spent), spent)
+
+def flow_direction(x, y, radius):
+    # unit step toward the player along the field, None where the field has no
+    # step (the player's own cell, cut off from it, or no field finished yet)
+    active = flow_active.get(flow_class(radius))
+    if active is None:
+        return None
+    nxt = active[1][flow_cell(x, y)]
+    if nxt < 0:
+        return None
+    tx, ty = (player_x, player_y) if nxt == flow_cell(player_x, player_y) else flow_cell_center(nxt)
+    dx, dy = tx - x, ty - y
+    d = math.hypot(dx, dy)
+    if d == 0:
+        return None
+    return dx / d, dy / d
+
+# FRUSTUM CULLING
+# setupCamera rebuilds the view-projection matrix from its gluLookAt/gluPerspective
+# parameters and extracts the six clip planes, so everything can be tested
+# against the frustum by bounding sphere before a single GL call is issued.
+
+CAMERA_ASPECT, CAMERA_NEAR, CAMERA_FAR = 1.25, 0.1, 4000.0
+TREE_CULL_Z, TREE_CULL_RADIUS = 42.5, 50.0         # per unit of tree scale
+ENEMY_CULL_Z, ENEMY_CULL_RADIUS = 50.0, 100.0      # body, gun barrel and health bar
+camera_eye = (0.0, 0.0, 0.0)
+frustum_planes = []     # (a, b, c, d), inside where a*x + b*y + c*z + d >= 0
+cull_counts = {}        # kind -> (drawn, culled) in the last frame
+
+def view_projection(eye, target, up=(0.0, 0.0, 1.0)):
+    # the matrix gluPerspective * gluLookAt leave on the stacks, as rows
+    f = [t - e for t, e in zip(target, eye)]
+    n = math.sqrt(sum(c * c for c in f))
+    f = [c / n for c in f]
+    side = [f[1] * up[2] - f[2] * up[1], f[2] * up[0] - f[0] * up[2], f[0] * up[1] - f[1] * up[0]]
+    n = math.sqrt(sum(c * c for c in side))
+    side = [c / n for c in side]
+    u = [side[1] * f[2] - side[2] * f[1], side[2] * f[0] - side[0] * f[2], side[0] * f[1] - side[1] * f[0]]
+    view = [side + [-sum(a * b for a, b in zip(side, eye))],
+            u + [-sum(a * b for a, b in zip(u, eye))],
+            [-c for c in f] + [sum(a * b for a, b in zip(f, eye))],
+            [0.0, 0.0, 0.0, 1.0]]
+    g = 1.0 / math.tan(math.radians(fovY) / 2)
+    projection = [[g / CAMERA_ASPECT, 0, 0, 0], [0, g, 0, 0],
+                  [0, 0, (CAMERA_FAR + CAMERA_NEAR) / (CAMERA_NEAR - CAMERA_FAR), 2 * CAMERA_FAR * CAMERA_NEAR / (CAMERA_NEAR - CAMERA_FAR)],
+                  [0, 0, -1, 0]]
+    return [[sum(projection[r][k] * view[k][c] for k in range(4)) for c in range(4)] for r in range(4)]
+
+def update_frustum(eye, target):
+    global camera_eye
+    m = view_projection(eye, target)
+    frustum_planes.clear()
+    for row in range(3):
+        for sign in (1, -1):
+            plane = [m[3][c] + sign * m[row][c] for c in range(4)]
+            n = math.sqrt(plane[0]**2 + plane[1]**2 + plane[2]**2)
+            frustum_planes.append(tuple(c / n for c in plane))
+    camera_eye = eye
+
+def sphere_visible(x, y, z, radius):
+    for a, b, c, d in frustum_planes:
+        if a * x + b * y + c * z + d < -radius:
             return False
     return True
 
+def spheres_visible(x, y, z, radius):
+    visible = np.ones(np.broadcast(x, y, z, radius).shape, dtype=bool)
+    for a, b, c, d in frustum_planes:
+        visible &= a * x + b * y + c * z + d >= -radius
+    return visible
+
+def enemy_visible(e):
+    return sphere_visible(e[0], e[1], ENEMY_CULL_Z, ENEMY_CULL_RADIUS)
+
+def bullet_visible(b):
+    if b[6] == BULLET_SHOCKWAVE:
+        return sphere_visible(b[0], b[1], 2.0, b[7] + 1.0)
+    return sphere_visible(b[0], b[1], b[2], 5.0)
+
+def enemy_bullet_visible(b):
+    return sphere_visible(b[0], b[1], b[2], 4.0)
+
+def count_culled(kind, drawn, total):
+    cull_counts[kind] = (drawn, total - drawn)
+
+# LEVEL OF DETAIL
+# Models come in LOD_LEVELS tessellations (see tess). The level follows the
+# projected radius in pixels from the eye set by setupCamera; the thresholds
+# move LOD_HYSTERESIS away from whichever side an object is on, so one that
+# hovers around a boundary does not flicker between levels. Trees keep their
+# level in tree_lod, enemies in e[12]. Projectiles are tiny and short-lived and
+# skip the hysteresis.
+
+LOD_LEVELS = 3
+LOD_PIXELS = (30.0, 12.0)     # below LOD_PIXELS[k] pixels: level k + 1
+LOD_HYSTERESIS = 0.15
+ENEMY_LOD_RADIUS = 45.0
+LOD_PIXEL_SCALE = 400.0 / math.tan(math.radians(fovY) / 2)    # pixels per unit at distance 1, 800 px viewport
+tree_lod = []           # per tree_positions entry, reset by index_scenery
+
+def projected_pixels(x, y, z, radius):
+    return radius * LOD_PIXEL_SCALE * lod_pixel_scale / max(math.dist(camera_eye, (x, y, z)), 1.0)
+
+def projected_pixels_array(x, y, z, radius):
+    ex, ey, ez = camera_eye
+    return radius * LOD_PIXEL_SCALE * lod_pixel_scale / np.maximum(np.sqrt((x - ex)**2 + (y - ey)**2 + (z - ez)**2), 1.0)
+
+def lod_level(pixels, previous):
+    level = 0
+    for k, limit in enumerate(LOD_PIXELS):
+        if pixels < limit * (1 + LOD_HYSTERESIS if previous > k else 1 - LOD_HYSTERESIS):
+            level += 1
+    return level
+
+def lod_levels(pixels, previous):
+    level = np.zeros(len(pixels), dtype=int)
+    for k, limit in enumerate(LOD_PIXELS):
+        level += pixels < np.where(previous > k, limit * (1 + LOD_HYSTERESIS), limit * (1 - LOD_HYSTERESIS))
+    return level
+
+# MESH CACHE
+# Models are written once against a small GL-like interface (push/pop,
+# translate/rotate/scale, color, cylinder/sphere/cube/polygon/...). MeshBuilder
+# records them into a VBO the first time a (model, detail) pair is drawn;
+# GLModelWriter replays them in immediate mode when VBOs are unavailable.
+
+VERTEX_FLOATS = 7       # x, y, z, r, g, b, tinted
+mesh_cache = {}
+mesh_cache_enabled = False
+world_batch = None
+scenery_generation = 0  # bumped by index_scenery, tells draw_environment to re-bake
+
+def tess(n, detail, minimum=3):
+    # slices/stacks for a detail level: 0 is the full tessellation, each level halves it
+    return max(minimum, n >> detail)
+
+# Immediate mode shares one GLU quadric per draw style instead of allocating a
+# new one per draw call; quadric_counts lets a long session check for leaks.
+quadric_pool = {}
+quadric_counts = {'created': 0, 'deleted': 0}
+
+def get_quadric(style=GLU_FILL):
+    q = quadric_pool.get(style)
+    if q is None:
+        q = quadric_pool[style] = gluNewQuadric()
+        gluQuadricDrawStyle(q, style)
+        quadric_counts['created'] += 1
+    return q
+
+def live_quadrics():
+    # allocated and not yet deleted; stays at len(quadric_pool) unless something leaks
+    return quadric_counts['created'] - quadric_counts['deleted']
+
+def release_quadric_pool():
+    for q in quadric_pool.values():
+        gluDeleteQuadric(q)
+        quadric_counts['deleted'] += 1
+    quadric_pool.clear()
+
+class GLModelWriter:
+    def __init__(self, tint=1.0):
+        self.tint = tint
+
+    def push(self):
+        glPushMatrix()
+
+    def pop(self):
+        glPopMatrix()
+
+    def translate(self, x, y, z):
+        glTranslatef(x, y, z)
+
+    def rotate(self, angle, x, y, z):
+        glRotatef(angle, x, y, z)
+
+    def scale(self, x, y, z):
+        glScalef(x, y, z)
+
+    def color(self, r, g, b, tinted=False):
+        t = self.tint if tinted else 1.0
+        glColor3f(r * t, g * t, b * t)
+
+    def cylinder(self, base, top, height, slices, stacks):
+        gluCylinder(get_quadric(), base, top, height, slices, stacks)
+
+    def sphere(self, radius, slices, stacks):
+        gluSphere(get_quadric(), radius, slices, stacks)
+
+    def cube(self, size):
+        glutSolidCube(size)
+
+    def polygon(self, points):
+        glBegin(GL_POLYGON)
+        for p in points:
+            glVertex3f(p[0], p[1], p[2])
+        glEnd()
+
+    def quads(self, points):
+        glBegin(GL_QUADS)
+        for p in points:
+            glVertex3f(p[0], p[1], p[2])
+        glEnd()
+
+    def line_loop(self, points):
+        glBegin(GL_LINE_LOOP)
+        for p in points:
+            glVertex3f(p[0], p[1], p[2])
+        glEnd()
+
+class MeshBuilder:
+    def __init__(self):
+        self.matrix = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]]
+        self.stack = []
+        self.rgb, self.tinted = (1.0, 1.0, 1.0), False
+        self.vertices = []
+        self.parts = []     # [mode, r, g, b, tinted, first, count]
+
+    def push(self):
+        self.stack.append([row[:] for row in self.matrix])
+
+    def pop(self):
+        self.matrix = self.stack.pop()
+
+    def _apply(self, m):
+        a = self.matrix
+        self.matrix = [[a[r][0] * m[0][c] + a[r][1] * m[1][c] + a[r][2] * m[2][c] + (a[r][3] if c == 3 else 0.0)
+                        for c in range(4)] for r in range(3)]
+
+    def translate(self, x, y, z):
+        self._apply([[1, 0, 0, x], [0, 1, 0, y], [0, 0, 1, z]])
+
+    def rotate(self, angle, x, y, z):
+        n = math.sqrt(x*x + y*y + z*z)
+        x, y, z = x / n, y / n, z / n
+        c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        k = 1 - c
+        self._apply([[x*x*k + c, x*y*k - z*s, x*z*k + y*s, 0],
+                     [y*x*k + z*s, y*y*k + c, y*z*k - x*s, 0],
+                     [x*z*k - y*s, y*z*k + x*s, z*z*k + c, 0]])
+
+    def scale(self, x, y, z):
+        self._apply([[x, 0, 0, 0], [0, y, 0, 0], [0, 0, z, 0]])
+
+    def color(self, r, g, b, tinted=False):
+        self.rgb, self.tinted = (r, g, b), tinted
+
+    def _emit(self, mode, points):
+        m = self.matrix
+        first = len(self.vertices) // VERTEX_FLOATS
+        flag = 1.0 if self.tinted else 0.0
+        for x, y, z in points:
+            self.vertices.extend((m[0][0]*x + m[0][1]*y + m[0][2]*z + m[0][3],
+                                  m[1][0]*x + m[1][1]*y + m[1][2]*z + m[1][3],
+                                  m[2][0]*x + m[2][1]*y + m[2][2]*z + m[2][3],
+                                  self.rgb[0], self.rgb[1], self.rgb[2], flag))
+        last = self.parts[-1] if self.parts else None
+        if mode == GL_TRIANGLES and last and last[:5] == [mode, *self.rgb, self.tinted] and last[5] + last[6] == first:
+            last[6] += len(points)
+        else:
+            self.parts.append([mode, *self.rgb, self.tinted, first, len(points)])
+
+    def _grid(self, rows):
+        # rows of rings -> two triangles per quad between neighbouring rings
+        tris = []
+        for ring0, ring1 in zip(rows, rows[1:]):
+            for i in range(len(ring0) - 1):
+                tris += [ring0[i], ring1[i], ring1[i + 1], ring0[i], ring1[i + 1], ring0[i + 1]]
+        self._emit(GL_TRIANGLES, tris)
+
+    # same vertex layout as GLU: angle measured from +y, so low slice counts line up
+    def cylinder(self, base, top, height, slices, stacks):
+        rows = []
+        for st in range(stacks + 1):
+            r, z = base + (top - base) * st / stacks, height * st / stacks
+            rows.append([(r * math.sin(2 * math.pi * i / slices), r * math.cos(2 * math.pi * i / slices), z)
+                         for i in range(slices + 1)])
+        self._grid(rows)
+
+    def sphere(self, radius, slices, stacks):
+        rows = []
+        for st in range(stacks + 1):
+            phi = math.pi * st / stacks
+            r, z = radius * math.sin(phi), -radius * math.cos(phi)
+            rows.append([(r * math.sin(2 * math.pi * i / slices), r * math.cos(2 * math.pi * i / slices), z)
+                         for i in range(slices + 1)])
+        self._grid(rows)
+
+    def cube(self, size):
+        h = size / 2.0
+        for axis in range(3):
+            for sign in (-h, h):
+                corners = []
+                for u, v in ((-h, -h), (h, -h), (h, h), (-h, h)):
+                    p = [u, v]
+                    p.insert(axis, sign)
+                    corners.append(tuple(p))
+                self.quads(corners)
+
+    def polygon(self, points):
+        tris = []
+        for i in range(1, len(points) - 1):
+            tris += [points[0], points[i], points[i + 1]]
+        self._emit(GL_TRIANGLES, tris)
+
+    def quads(self, points):
+        tris = []
+        for i in range(0, len(points), 4):
+            a, b, c, d = points[i:i + 4]
+            tris += [a, b, c, a, c, d]
+        self._emit(GL_TRIANGLES, tris)
+
+    def line_loop(self, points):
+        self._emit(GL_LINE_LOOP, points)
+
+    def vertex_count(self):
+        return len(self.vertices) // VERTEX_FLOATS
+
+class Mesh:
+    def __init__(self, builder):
+        self.vbo = vbo.VBO(np.array(builder.vertices, dtype=np.float32))
+        self.parts = [tuple(part) for part in builder.parts]
+        self.runs = []      # [mode, first, count], consecutive parts merged when colours come from the array
+        for mode, r, g, b, tinted, first, count in self.parts:
+            if self.runs and self.runs[-1][0] == mode and self.runs[-1][1] + self.runs[-1][2] == first:
+                self.runs[-1][2] += count
+            else:
+                self.runs.append([mode, first, count])
+
+    def draw(self, tint=1.0):
+        self.vbo.bind()
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, VERTEX_FLOATS * 4, self.vbo)
+        for mode, r, g, b, tinted, first, count in self.parts:
+            t = tint if tinted else 1.0
+            glColor3f(r * t, g * t, b * t)
+            glDrawArrays(mode, first, count)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        self.vbo.unbind()
+
+    def delete(self):
+        self.vbo.delete()
+
+def build_model(name, detail=0):
+    builder = MeshBuilder()
+    MODELS[name](builder, detail)
+    return builder
+
+def get_mesh(name, detail=0):
+    mesh = mesh_cache.get((name, detail))
+    if mesh is None:
+        mesh = mesh_cache[(name, detail)] = Mesh(build_model(name, detail))
+    return mesh
+
+def draw_model(name, tint=1.0, detail=0):
+    if mesh_cache_enabled:
+        get_mesh(name, detail).draw(tint)
+    else:
+        MODELS[name](GLModelWriter(tint), detail)
+
+def init_mesh_cache(enabled=True):
+    # needs numpy for the vertex arrays and GL 1.5 buffer objects
+    global mesh_cache_enabled
+    mesh_cache_enabled = enabled and np is not None and bool(glGenBuffers)
+    if mesh_cache_enabled:
+        for name in MODELS:
+            for detail in range(LOD_LEVELS):
+                get_mesh(name, detail)
+
+def release_gl_resources():
+    release_mesh_cache()
+    release_instancing()
+    release_quadric_pool()
+    release_glyph_atlas()
+
+def release_mesh_cache():
+    global world_batch
+    for mesh in mesh_cache.values():
+        mesh.delete()
+    mesh_cache.clear()
+    if world_batch is not None:
+        world_batch.delete()
+        world_batch = None
+
+# Static world: ground, pond, trees and walls baked into one interleaved
+# position/colour buffer and drawn with a single glDrawArrays. Every part is a
+# triangle list with its colour stored per vertex, so no state changes are needed.
+class WorldBatch:
+    def __init__(self, builder, static_range, tree_ranges, generation):
+        self.vbo = vbo.VBO(np.array(builder.vertices, dtype=np.float32))
+        self.count = builder.vertex_count()
+        self.static_range = static_range                  # ground, pond and walls
+        self.tree_ranges = np.array(tree_ranges, dtype=np.int32).reshape(LOD_LEVELS, -1, 2)   # [level, tree] -> (first, count)
+        self.generation = generation
+        spheres = [(x, y, TREE_CULL_Z * scale, TREE_CULL_RADIUS * scale) for x, y, scale in tree_positions]
+        self.tree_spheres = np.array(spheres, dtype=float).reshape(-1, 4).T
+
+    def visible_ranges(self):
+        visible = np.flatnonzero(spheres_visible(*self.tree_spheres))
+        count_culled('trees', len(visible), self.tree_spheres.shape[1])
+        levels = lod_levels(projected_pixels_array(*self.tree_spheres[:, visible]), np.array(tree_lod, dtype=int)[visible])
+        for i, level in zip(visible.tolist(), levels.tolist()):
+            tree_lod[i] = level
+        ranges = np.concatenate([[self.static_range], self.tree_ranges[levels, visible]])
+        ranges = ranges[np.argsort(ranges[:, 0], kind='stable')]
+        # merge neighbouring ranges so a fully visible, full-detail world is still one draw
+        ends = ranges[:, 0] + ranges[:, 1]
+        starts = np.concatenate([[True], ranges[1:, 0] != ends[:-1]])
+        firsts = ranges[starts, 0]
+        last = np.concatenate([np.flatnonzero(starts)[1:] - 1, [len(ranges) - 1]])
+        return firsts.astype(np.int32), (ends[last] - firsts).astype(np.int32)
+
+    def draw(self):
+        stride = VERTEX_FLOATS * 4
+        firsts, counts = self.visible_ranges()
+        self.vbo.bind()
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stride, self.vbo)
+        glColorPointer(3, GL_FLOAT, stride, self.vbo + 12)
+        if len(firsts) == 1:
+            glDrawArrays(GL_TRIANGLES, int(firsts[0]), int(counts[0]))
+        else:
+            glMultiDrawArrays(GL_TRIANGLES, firsts, counts, len(firsts))
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        self.vbo.unbind()
+
+    def delete(self):
+        self.vbo.delete()
+
+def rebuild_world_batch():
+    # static parts first, then every tree at every LOD level, level-major, so
+    # the level 0 trees directly follow the static parts
+    global world_batch
+    builder = MeshBuilder()
+    model_ground(builder, 0)
+    model_pond(builder, 0)
+    model_boundary_walls(builder, 0)
+    static_range = (0, builder.vertex_count())
+    tree_ranges = []
+    for detail in range(LOD_LEVELS):
+        for position in tree_positions:
+            first = builder.vertex_count()
+            model_placed_tree(builder, position, detail)
+            tree_ranges.append((first, builder.vertex_count() - first))
+    if world_batch is not None:
+        world_batch.delete()
+    world_batch = WorldBatch(builder, static_range, tree_ranges, scenery_generation)
+
+# INSTANCED RENDERING
+# Opt-in (--instanced): each frame the enemies and projectiles are packed into one
+# per-instance array (x, y, z, yaw, scale, tint) and every model is drawn with a
+# single glDrawArraysInstanced over its cached mesh. Health bars become one
+# client-array pass. Falls back to the per-entity mesh path if the shaders fail.
+
+INSTANCE_FLOATS = 6
+# NVIDIA's compatibility profile aliases generic attributes with the fixed ones
+# (0 gl_Vertex, 2 gl_Normal, 3 gl_Color, 4 gl_SecondaryColor, 5 gl_FogCoord,
+# 8+ gl_MultiTexCoord0+), so the instance attributes keep off 0 and 3, which the
+# shader reads, and off the others where there is room
+ATTRIB_TINTED, ATTRIB_POSE, ATTRIB_SCALE, ATTRIB_TINT = 1, 6, 7, 9
+instancing_enabled = False
+instance_program = None
+instance_buffer = None
+
+INSTANCE_VERTEX_SHADER = """
+#version 120
+attribute float tinted;
+attribute vec4 pose;        // x, y, z, yaw in radians
+attribute float scale;
+attribute float tint;
+void main() {
+    float c = cos(pose.w), s = sin(pose.w);
+    vec3 p = gl_Vertex.xyz * scale;
+    p = vec3(c * p.x - s * p.y, s * p.x + c * p.y, p.z) + pose.xyz;
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(p, 1.0);
+    gl_FrontColor = vec4(gl_Color.rgb * mix(1.0, tint, tinted), 1.0);
+}
+"""
+
+INSTANCE_FRAGMENT_SHADER = """
+#version 120
+void main() {
+    gl_FragColor = gl_Color;
+}
+"""
+
+ENEMY_MODELS = {0: 'soldier0', 1: 'tank', 2: 'soldier2', 3: 'soldier3', 4: 'kamikaze'}
+
+def init_instancing(enabled=True):
+    global instancing_enabled, instance_program, instance_buffer
+    instancing_enabled = False
+    if not (enabled and mesh_cache_enabled and bool(glDrawArraysInstanced) and bool(glVertexAttribDivisor)):
+        return
+    try:
+        program = shaders.compileProgram(shaders.compileShader(INSTANCE_VERTEX_SHADER, GL_VERTEX_SHADER),
+                                         shaders.compileShader(INSTANCE_FRAGMENT_SHADER, GL_FRAGMENT_SHADER))
+        # fixed locations, clear of the aliased ones above
+        for location, name in ((ATTRIB_TINTED, 'tinted'), (ATTRIB_POSE, 'pose'), (ATTRIB_SCALE, 'scale'), (ATTRIB_TINT, 'tint')):
+            glBindAttribLocation(program, location, name)
+        glLinkProgram(program)
+        if not glGetProgramiv(program, GL_LINK_STATUS):
+            raise RuntimeError(glGetProgramInfoLog(program))
+    except RuntimeError:
+        return
+    instance_program = program
+    instance_buffer = vbo.VBO(np.zeros(INSTANCE_FLOATS, dtype=np.float32), usage=GL_STREAM_DRAW)
+    instancing_enabled = True
+
+def release_instancing():
+    global instancing_enabled, instance_program, instance_buffer
+    if instance_buffer is not None:
+        instance_buffer.delete()
+        instance_buffer = None
+    if instance_program is not None:
+        glDeleteProgram(instance_program)
+        instance_program = None
+    instancing_enabled = False
+
+def entity_columns(entities, fields):
+    # (fields, n) array of the first `fields` values of every row, short rows zero-padded
+    if isinstance(entities, EntityStore):
+        return entities.data[:fields, :len(entities)]
+    rows = [list(row[:fields]) + [0.0] * (fields - len(row)) for row in entities]
+    return np.array(rows, dtype=float).reshape(-1, fields).T
+
+def instance_block(x, y, z, yaw, scale, tint):
+    block = np.empty((len(x), INSTANCE_FLOATS), dtype=np.float32)
+    for k, column in enumerate((x, y, z, yaw, scale, tint)):
+        block[:, k] = column
+    return block
+
+def collect_instances():
+    # (model name, detail, instance block), using the same interpolation as the per-entity draws
+    groups = []
+    state = frame_state
+    lag = 1.0 - render_alpha
+    
+    e = entity_columns(state.enemies, 13)
+    visible = np.flatnonzero(spheres_visible(e[0], e[1], ENEMY_CULL_Z, ENEMY_CULL_RADIUS))
+    e = e[:, visible]
+    x, y = e[10] + (e[0] - e[10]) * render_alpha, e[11] + (e[1] - e[11]) * render_alpha
+    yaw = np.where(e[3] == 3, 0.0, np.arctan2(state.player_y - y, state.player_x - x))
+    pulse_scale = 1 + 0.1 * sin_approx(state.enemy_pulse)
+    count_culled('enemies', len(visible), len(state.enemies))
+    levels = lod_levels(projected_pixels_array(x, y, ENEMY_CULL_Z, ENEMY_LOD_RADIUS), e[12])
+    if soa_backend:
+        state.enemies.data[12, visible] = levels
+    else:
+        for i, level in zip(visible.tolist(), levels.tolist()):
+            state.enemies[i][12] = level
+    for etype, name in ENEMY_MODELS.items():
+        for detail in range(LOD_LEVELS):
+            sel = (e[3] == etype) & (levels == detail)
+            if sel.any():
+                groups.append((name, detail, instance_block(x[sel], y[sel], 0.0, yaw[sel], pulse_scale, e[4][sel] / e[5][sel])))
+    
+    b = entity_columns(state.bullets, 8)
+    shot = b[6] != BULLET_SHOCKWAVE
+    b = b[:, spheres_visible(b[0], b[1], np.where(shot, b[2], 2.0), np.where(shot, 5.0, b[7] + 1.0))]
+    shot = b[6] != BULLET_SHOCKWAVE
+    if shot.any():
+        groups.append(('bullet', 0, instance_block(b[0][shot] - b[3][shot] * lag, b[1][shot] - b[4][shot] * lag,
+                                                b[2][shot], 0.0, 1.0, 1.0)))
+    if (~shot).any():
+        wave = ~shot
+        groups.append(('ring', 0, instance_block(b[0][wave], b[1][wave], 2.0, 0.0,
+                                              np.maximum(0.0, b[7][wave] - 20 * lag), 1.0)))
+    
+    eb = entity_columns(state.enemy_bullets, 7)
+    eb = eb[:, spheres_visible(eb[0], eb[1], eb[2], 4.0)]
+    count_culled('projectiles', b.shape[1] + eb.shape[1], len(state.bullets) + len(state.enemy_bullets))
+    ex, ey = eb[0] - eb[3] * lag, eb[1] - eb[4] * lag
+    levels = lod_levels(projected_pixels_array(ex, ey, eb[2], 4.0), np.zeros(eb.shape[1]))
+    for etype in list(ENEMY_BULLET_COLORS) + [None]:
+        of_type = np.isin(eb[6], list(ENEMY_BULLET_COLORS), invert=True) if etype is None else eb[6] == etype
+        name = 'enemy_bullet' if etype is None else 'enemy_bullet%d' % etype
+        for detail in range(LOD_LEVELS):
+            sel = of_type & (levels == detail)
+            if sel.any():
+                groups.append((name, detail, instance_block(ex[sel], ey[sel], eb[2][sel], 0.0, 1.0, 1.0)))
+    return groups
+
+def draw_entities_instanced():
+    groups = collect_instances()
+    if groups:
+        instance_buffer.set_array(np.concatenate([block for _, _, block in groups]))
+        glUseProgram(instance_program)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        for location in (ATTRIB_TINTED, ATTRIB_POSE, ATTRIB_SCALE, ATTRIB_TINT):
+            glEnableVertexAttribArray(location)
+        for location in (ATTRIB_POSE, ATTRIB_SCALE, ATTRIB_TINT):
+            glVertexAttribDivisor(location, 1)
+        
+        stride = VERTEX_FLOATS * 4
+        offset = 0
+        for name, detail, block in groups:
+            mesh = get_mesh(name, detail)
+            mesh.vbo.bind()
+            glVertexPointer(3, GL_FLOAT, stride, mesh.vbo)
+            glColorPointer(3, GL_FLOAT, stride, mesh.vbo + 12)
+            glVertexAttribPointer(ATTRIB_TINTED, 1, GL_FLOAT, GL_FALSE, stride, mesh.vbo + 24)
+            
+            instance_buffer.bind()
+            base = instance_buffer + offset * INSTANCE_FLOATS * 4
+            glVertexAttribPointer(ATTRIB_POSE, 4, GL_FLOAT, GL_FALSE, INSTANCE_FLOATS * 4, base)
+            glVertexAttribPointer(ATTRIB_SCALE, 1, GL_FLOAT, GL_FALSE, INSTANCE_FLOATS * 4, base + 16)
+            glVertexAttribPointer(ATTRIB_TINT, 1, GL_FLOAT, GL_FALSE, INSTANCE_FLOATS * 4, base + 20)
+            for mode, first, count in mesh.runs:
+                glDrawArraysInstanced(mode, first, count, len(block))
+            offset += len(block)
+        
+        instance_buffer.unbind()
+        for location in (ATTRIB_POSE, ATTRIB_SCALE, ATTRIB_TINT):
+            glVertexAttribDivisor(location, 0)
+        for location in (ATTRIB_TINTED, ATTRIB_POSE, ATTRIB_SCALE, ATTRIB_TINT):
+            glDisableVertexAttribArray(location)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glUseProgram(0)
+    if health_bars_enabled:
+        draw_health_bars_batched()
+
+def draw_health_bars_batched():
+    e = entity_columns(frame_state.enemies, 13)
+    e = e[:, (e[4] < e[5]) & spheres_visible(e[0], e[1], ENEMY_CULL_Z, ENEMY_CULL_RADIUS)]
+    if e.shape[1] == 0:
+        return
+    x, y = e[10] + (e[0] - e[10]) * render_alpha, e[11] + (e[1] - e[11]) * render_alpha
+    z = e[2] + np.where(e[3] == 1, 80, 100)
+    ratio = e[4] / e[5]
+    right = x - 20 + 40 * ratio
+    
+    # black background quads, then the coloured fills 0.1 above them; the fills
+    # are pulled forward with a polygon offset since 0.1 is below depth precision
+    # at world coordinates
+    corners = [(x - 20, y - 3, z), (x + 20, y - 3, z), (x + 20, y + 3, z), (x - 20, y + 3, z),
+               (x - 20, y - 3, z + 0.1), (right, y - 3, z + 0.1), (right, y + 3, z + 0.1), (x - 20, y + 3, z + 0.1)]
+    n = len(x)
+    vertices = np.empty((2, n, 4, 3), dtype=np.float32)
+    for k, (cx, cy, cz) in enumerate(corners):
+        vertices[k // 4, :, k % 4, 0], vertices[k // 4, :, k % 4, 1], vertices[k // 4, :, k % 4, 2] = cx, cy, cz
+    colors = np.zeros((2, n, 4, 3), dtype=np.float32)
+    colors[1] = np.select([ratio[:, None] > 0.6, ratio[:, None] > 0.3], [[0.1, 0.9, 0.1], [0.9, 0.9, 0.1]], [0.9, 0.1, 0.1])[:, None]
+    
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_COLOR_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, vertices)
+    glColorPointer(3, GL_FLOAT, 0, colors)
+    glDrawArrays(GL_QUADS, 0, n * 4)
+    glEnable(GL_POLYGON_OFFSET_FILL)
+    glPolygonOffset(-1.0, -1.0)
+    glDrawArrays(GL_QUADS, n * 4, n * 4)
+    glDisable(GL_POLYGON_OFFSET_FILL)
+    glDisableClientState(GL_COLOR_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+
 # Drawing
 
 def draw_hud():
-    hp_ratio = max(0, player_hp / PLAYER_MAX_HP)
+    state = frame_state
+    hp_ratio = max(0, state.player_hp / PLAYER_MAX_HP)
     if hp_ratio > 0.6:
-        glColor3f(0.2, 1.0, 0.2)
+        hp_color = (0.2, 1.0, 0.2)
     elif hp_ratio > 0.3:
-        glColor3f(1.0, 1.0, 0.2)
+        hp_color = (1.0, 1.0, 0.2)
     else:
-        glColor3f(1.0, 0.2, 0.2)
-    draw_text(10, 760, f"Player HP: {int(player_hp)} / {PLAYER_MAX_HP}")
+        hp_color = (1.0, 0.2, 0.2)
+    draw_text(10, 760, f"Player HP: {int(state.player_hp)} / {PLAYER_MAX_HP}", color=hp_color)
     
     glMatrixMode(GL_PROJECTION)
     glPushMatrix()
@@ -141,12 +1341,7 @@ def draw_hud():
     glVertex3f(bar_x, bar_y + bar_h, 0)
     glEnd()
     
-    if hp_ratio > 0.6:
-        glColor3f(0.2, 1.0, 0.2)
-    elif hp_ratio > 0.3:
-        glColor3f(1.0, 1.0, 0.2)
-    else:
-        glColor3f(1.0, 0.2, 0.2)
+    glColor3f(*hp_color)
     glBegin(GL_QUADS)
     glVertex3f(bar_x, bar_y, 0)
     glVertex3f(bar_x + bar_w * hp_ratio, bar_y, 0)
@@ -159,49 +1354,155 @@ def draw_hud():
     glPopMatrix()
     glMatrixMode(GL_MODELVIEW)
     
-    glColor3f(1, 1, 1)
-    draw_text(10, 730, f"Score: {score}")
-    draw_text(10, 705, f"Difficulty Level: {difficulty}")
+    draw_text(10, 730, f"Score: {state.score}")
+    draw_text(10, 705, f"Difficulty Level: {state.difficulty}")
 
     weapon_names = ["Normal", "Laser", "Burst", "Shockwave"]
-    draw_text(800, 60, "Weapon: " + weapon_names[current_weapon] + " (1-4)")
+    draw_text(800, 60, "Weapon: " + weapon_names[state.current_weapon] + " (1-4)")
     cam_name = ["Orbit", "Turret Follow", "First Person"][camera_mode]
     draw_text(800, 30, "Camera: " + cam_name + " (Q)")
     
-    if game_state == GAME_PAUSED:
+    if state.game_state == GAME_PAUSED:
         draw_text(350, 400, "PAUSED - PRESS SPACE TO RESUME")
         draw_text(390, 370, "PRESS R TO RESTART")
-    elif game_state == GAME_OVER:
+    elif state.game_state == GAME_OVER:
         draw_text(400, 400, "GAME OVER - PRESS R")
-
-def create_scenery(num_trees=150):
-    tree_positions.clear()
-    for _ in range(num_trees):
-        while True:
-            buffer = 50.0
-            x = random.uniform(-GRID_LENGTH+buffer, GRID_LENGTH-buffer)
-            y = random.uniform(-GRID_LENGTH+buffer, GRID_LENGTH-buffer)
-            if math.hypot(x, y) > 200 and math.hypot(x-pond_data['x'], y-pond_data['y']) > POND_RADIUS+TREE_RADIUS:
-                tree_positions.append((x, y, random.uniform(0.8, 1.5)))
+    
+    if profile_overlay:
+        draw_profile_overlay()
+    flush_text()
+
+# SCENERY & SPAWN TABLES
+# Trees come from a Poisson-disc sample spaced for about POISSON_FILL times the
+# requested count, never closer than TREE_SPACING so the largest enemy fits
+# between any two, thinned at random to the requested count. More trees than
+# fit at TREE_SPACING (a few hundred) are all still placed: the rest go on
+# random valid sites as before, without the spacing guarantee. Enemy spawn
+# points and booster spots are drawn from per-scenery tables of points already
+# known to be valid (for snipers, with line of sight to the centre), so a spawn
+# is one random.choice instead of rejection sampling with tree scans.
+
+TREE_SPACING = 2 * (MAX_ENEMY_RADIUS + TREE_RADIUS)
+POISSON_ATTEMPTS = 30
+POISSON_FILL = 1.6
+SPAWN_ANGLES = 360          # points per ring in a spawn table
+SPAWN_RING_STEP = 40.0      # distance between the rings of an annulus table
+spawn_tables = {}           # (kind, radius) -> [(x, y)], built on first use per scenery
+
+def tree_site_valid(x, y):
+    return math.hypot(x, y) > 200 and math.hypot(x-pond_data['x'], y-pond_data['y']) > POND_RADIUS+TREE_RADIUS
+
+def poisson_disc_points(min_x, min_y, max_x, max_y, spacing, accept):
+    # Bridson's sampler: grows outward from a seed, trying POISSON_ATTEMPTS
+    # candidates in the annulus [spacing, 2 * spacing] around an active point
+    # before retiring it; accept(x, y) masks out areas
+    cell = spacing / math.sqrt(2)     # at most one point per background cell
+    cols, rows = int((max_x - min_x) / cell) + 1, int((max_y - min_y) / cell) + 1
+    background = [None] * (cols * rows)
+    points = []
+    
+    def place(x, y):
+        if not (min_x <= x <= max_x and min_y <= y <= max_y and accept(x, y)):
+            return False
+        gx, gy = int((x - min_x) / cell), int((y - min_y) / cell)
+        for i in range(max(0, gx - 2), min(cols, gx + 3)):
+            for j in range(max(0, gy - 2), min(rows, gy + 3)):
+                other = background[i * rows + j]
+                if other is not None and math.hypot(other[0] - x, other[1] - y) < spacing:
+                    return False
+        background[gx * rows + gy] = (x, y)
+        points.append((x, y))
+        return True
+    
+    for _ in range(POISSON_ATTEMPTS):
+        if place(random.uniform(min_x, max_x), random.uniform(min_y, max_y)):
+            break
+    active = list(points)
+    while active:
+        k = random.randrange(len(active))
+        px, py = active[k]
+        for _ in range(POISSON_ATTEMPTS):
+            angle = random.uniform(0, 2 * math.pi)
+            dist = random.uniform(spacing, 2 * spacing)
+            if place(px + dist * math.cos(angle), py + dist * math.sin(angle)):
+                active.append(points[-1])
                 break
+        else:
+            active[k] = active[-1]
+            active.pop()
+    return points
+
+def polar_points(inner, outer):
+    # SPAWN_ANGLES points on every ring from inner to outer; as many per ring, so
+    # a uniform draw is uniform in angle and in distance
+    rings = [inner + i * SPAWN_RING_STEP for i in range(int((outer - inner) / SPAWN_RING_STEP) + 1)]
+    return [(r * math.cos(a), r * math.sin(a)) for r in rings for a in (2 * math.pi * k / SPAWN_ANGLES for k in range(SPAWN_ANGLES))]
+
+def build_spawn_table(kind, radius):
+    if kind == 'booster':
+        reach = TREE_RADIUS + health_booster_pos['radius']
+        return [(x, y) for x, y in polar_points(300, GRID_LENGTH - 200)
+                if all(math.hypot(x - tx, y - ty) >= reach for tx, ty, _ in trees_near(x, y, reach))]
+    if kind == 'initial':
+        points = polar_points(GRID_LENGTH - 600, GRID_LENGTH - 200)
+    else:
+        points = polar_points(GRID_LENGTH - radius - 100, GRID_LENGTH - radius - 100)
+    points = [p for p in points if is_position_valid_for_enemy_static(p[0], p[1], radius)]
+    if kind == 'sniper':
+        points = [p for p in points if check_line_of_sight(p, (0, 0))]
+    return points
+
+def spawn_table(kind, radius=0):
+    # kind: 'edge' (the spawn ring), 'sniper' (spawn ring, clear shot at the
+    # centre), 'initial' (the opening annulus) or 'booster'
+    table = spawn_tables.get((kind, radius))
+    if table is None:
+        table = spawn_tables[(kind, radius)] = build_spawn_table(kind, radius)
+    return table
 
-def draw_pond():
-    glPushMatrix()
-    glTranslatef(pond_data['x'], pond_data['y'], 0.1)
-    glColor3f(0.2, 0.4, 0.7)
-    glBegin(GL_POLYGON)
+def create_scenery(num_trees=150):
+    buffer = 50.0
+    bounds = (-GRID_LENGTH+buffer, -GRID_LENGTH+buffer, GRID_LENGTH-buffer, GRID_LENGTH-buffer)
+    # a maximal Poisson-disc set has about 0.6 points per spacing^2 of area
+    spacing = math.sqrt(0.6 * (2 * (GRID_LENGTH-buffer))**2 / (POISSON_FILL * max(1, num_trees)))
+    sites = poisson_disc_points(*bounds, max(TREE_SPACING, spacing), tree_site_valid)
+    if len(sites) < num_trees and spacing > TREE_SPACING:
+        sites = poisson_disc_points(*bounds, TREE_SPACING, tree_site_valid)
+    sites = random.sample(sites, min(num_trees, len(sites)))
+    while len(sites) < num_trees:
+        x, y = random.uniform(bounds[0], bounds[2]), random.uniform(bounds[1], bounds[3])
+        if tree_site_valid(x, y):
+            sites.append((x, y))
+    # replaced in one step each, since a --threaded renderer may be reading them
+    tree_positions[:] = [(x, y, random.uniform(0.8, 1.5)) for x, y in sites]
+    index_scenery()
+
+def index_scenery():
+    # everything derived from tree_positions
+    global scenery_generation
+    tree_lod[:] = [0] * len(tree_positions)
+    spawn_tables.clear()
+    build_tree_grid()
+    build_los_grid()
+    pack_tree_array()
+    reset_flow_fields()
+    scenery_generation += 1
+
+def model_pond(out, detail):
+    out.push()
+    out.translate(pond_data['x'], pond_data['y'], 0.1)
+    out.color(0.2, 0.4, 0.7)
+    points = []
     for i in range(33):
         angle = (i / 32) * 2 * math.pi
-        px = POND_RADIUS * math.cos(angle)
-        py = POND_RADIUS * math.sin(angle)
-        glVertex3f(px, py, 0)
-    glEnd()
-    glPopMatrix()
+        points.append((POND_RADIUS * math.cos(angle), POND_RADIUS * math.sin(angle), 0))
+    out.polygon(points)
+    out.pop()
 
 def draw_health_booster():
-    bx = health_booster_pos['x']
-    by = health_booster_pos['y']
-    b_pulse = health_booster_pos['pulse']
+    bx = frame_state.booster['x']
+    by = frame_state.booster['y']
+    b_pulse = frame_state.booster['pulse']
     
     glPushMatrix()
     glTranslatef(bx, by, 35)
@@ -210,276 +1511,286 @@ def draw_health_booster():
     glScalef(pulse_scale, pulse_scale, pulse_scale)
     
     glRotatef(b_pulse * 30, 0, 0, 1)
-    
-    glColor3f(1.0, 0.1, 0.1)
-    
-    q = gluNewQuadric()
-    
-    glPushMatrix()
-    glTranslatef(-7, 0, 5)
-    gluSphere(q, 9, 10, 10)
+    draw_model('booster')
     glPopMatrix()
+
+def model_booster(out, detail):
+    out.color(1.0, 0.1, 0.1)
     
-    glPushMatrix()
-    glTranslatef(7, 0, 5)
-    gluSphere(q, 9, 10, 10)
-    glPopMatrix()
+    out.push()
+    out.translate(-7, 0, 5)
+    out.sphere(9, tess(10, detail), tess(10, detail))
+    out.pop()
     
-    glPushMatrix()
-    glTranslatef(0, 0, 5)
-    glRotatef(180, 1, 0, 0)
-    gluCylinder(q, 14, 0, 22, 12, 1)
-    glPopMatrix()
+    out.push()
+    out.translate(7, 0, 5)
+    out.sphere(9, tess(10, detail), tess(10, detail))
+    out.pop()
     
-    glPushMatrix()
-    glTranslatef(0, 0, 3)
-    gluSphere(q, 7, 10, 10)
-    glPopMatrix()
+    out.push()
+    out.translate(0, 0, 5)
+    out.rotate(180, 1, 0, 0)
+    out.cylinder(14, 0, 22, tess(12, detail), 1)
+    out.pop()
     
-    glPopMatrix()
+    out.push()
+    out.translate(0, 0, 3)
+    out.sphere(7, tess(10, detail), tess(10, detail))
+    out.pop()
 
-def draw_boundary_walls():
+def model_boundary_walls(out, detail):
     WALL_HEIGHT = 200.0
-    glColor3f(0.3, 0.3, 0.35)
-    glBegin(GL_QUADS)
-    glVertex3f(-GRID_LENGTH, -GRID_LENGTH, 0)
-    glVertex3f(GRID_LENGTH, -GRID_LENGTH, 0)
-    glVertex3f(GRID_LENGTH, -GRID_LENGTH, WALL_HEIGHT)
-    glVertex3f(-GRID_LENGTH, -GRID_LENGTH, WALL_HEIGHT)
-    
-    glVertex3f(-GRID_LENGTH, GRID_LENGTH, 0)
-    glVertex3f(GRID_LENGTH, GRID_LENGTH, 0)
-    glVertex3f(GRID_LENGTH, GRID_LENGTH, WALL_HEIGHT)
-    glVertex3f(-GRID_LENGTH, GRID_LENGTH, WALL_HEIGHT)
-    
-    glVertex3f(GRID_LENGTH, -GRID_LENGTH, 0)
-    glVertex3f(GRID_LENGTH, GRID_LENGTH, 0)
-    glVertex3f(GRID_LENGTH, GRID_LENGTH, WALL_HEIGHT)
-    glVertex3f(GRID_LENGTH, -GRID_LENGTH, WALL_HEIGHT)
-    
-    glVertex3f(-GRID_LENGTH, -GRID_LENGTH, 0)
-    glVertex3f(-GRID_LENGTH, GRID_LENGTH, 0)
-    glVertex3f(-GRID_LENGTH, GRID_LENGTH, WALL_HEIGHT)
-    glVertex3f(-GRID_LENGTH, -GRID_LENGTH, WALL_HEIGHT)
-    glEnd()
+    out.color(0.3, 0.3, 0.35)
+    out.quads([(-GRID_LENGTH, -GRID_LENGTH, 0), (GRID_LENGTH, -GRID_LENGTH, 0),
+               (GRID_LENGTH, -GRID_LENGTH, WALL_HEIGHT), (-GRID_LENGTH, -GRID_LENGTH, WALL_HEIGHT),
+               (-GRID_LENGTH, GRID_LENGTH, 0), (GRID_LENGTH, GRID_LENGTH, 0),
+               (GRID_LENGTH, GRID_LENGTH, WALL_HEIGHT), (-GRID_LENGTH, GRID_LENGTH, WALL_HEIGHT),
+               (GRID_LENGTH, -GRID_LENGTH, 0), (GRID_LENGTH, GRID_LENGTH, 0),
+               (GRID_LENGTH, GRID_LENGTH, WALL_HEIGHT), (GRID_LENGTH, -GRID_LENGTH, WALL_HEIGHT),
+               (-GRID_LENGTH, -GRID_LENGTH, 0), (-GRID_LENGTH, GRID_LENGTH, 0),
+               (-GRID_LENGTH, GRID_LENGTH, WALL_HEIGHT), (-GRID_LENGTH, -GRID_LENGTH, WALL_HEIGHT)])
+
+def model_ground(out, detail):
+    out.color(0.45, 0.30, 0.15)
+    out.quads([(-GRID_LENGTH, -GRID_LENGTH, 0), (GRID_LENGTH, -GRID_LENGTH, 0),
+               (GRID_LENGTH, GRID_LENGTH, 0), (-GRID_LENGTH, GRID_LENGTH, 0)])
+
+def model_placed_tree(out, position, detail):
+    x, y, scale = position
+    out.push()
+    out.translate(x, y, 0)
+    out.scale(scale, scale, scale)
+    model_tree(out, detail)
+    out.pop()
+
+def model_world(out, detail, trees=None):
+    # everything that only changes with the scenery, in the old draw order;
+    # trees: (position, detail) pairs, every tree at `detail` by default
+    model_ground(out, detail)
+    model_pond(out, detail)
+    for position, tree_detail in ([(t, detail) for t in tree_positions] if trees is None else trees):
+        model_placed_tree(out, position, tree_detail)
+    model_boundary_walls(out, detail)
 
 def draw_environment():
-    glColor3f(0.45, 0.30, 0.15)
-    glBegin(GL_QUADS)
-    glVertex3f(-GRID_LENGTH, -GRID_LENGTH, 0)
-    glVertex3f(GRID_LENGTH, -GRID_LENGTH, 0)
-    glVertex3f(GRID_LENGTH, GRID_LENGTH, 0)
-    glVertex3f(-GRID_LENGTH, GRID_LENGTH, 0)
-    glEnd()
-    
-    draw_pond()
-    for pos in tree_positions:
-        draw_tree(pos)
-    draw_boundary_walls()
+    if not mesh_cache_enabled:
+        trees = []
+        for i, (x, y, scale) in enumerate(tree_positions):
+            if sphere_visible(x, y, TREE_CULL_Z * scale, TREE_CULL_RADIUS * scale):
+                tree_lod[i] = lod_level(projected_pixels(x, y, TREE_CULL_Z * scale, TREE_CULL_RADIUS * scale), tree_lod[i])
+                trees.append((tree_positions[i], tree_lod[i]))
+        count_culled('trees', len(trees), len(tree_positions))
+        model_world(GLModelWriter(), 0, trees)
+        return
+    if world_batch is None or world_batch.generation != scenery_generation:
+        rebuild_world_batch()
+    world_batch.draw()
 
-def draw_tree(position):
-    x, y, scale = position
-    glPushMatrix()
-    glTranslatef(x, y, 0)
-    glScalef(scale, scale, scale)
-    
-    glColor3f(0.5, 0.35, 0.05)
-    q = gluNewQuadric()
-    gluCylinder(q, 8, 8, 40, 10, 1)
+def model_tree(out, detail):
+    out.color(0.5, 0.35, 0.05)
+    out.cylinder(8, 8, 40, tess(10, detail), 1)
     
-    glColor3f(0.1, 0.6, 0.2)
-    glTranslatef(0, 0, 35)
-    gluCylinder(q, 25, 0, 50, 15, 5)
-    
-    glPopMatrix()
+    out.color(0.1, 0.6, 0.2)
+    out.translate(0, 0, 35)
+    out.cylinder(25, 0, 50, tess(15, detail), tess(5, detail, 1))
 
 def draw_turret():
     if camera_mode == CAM_FIRST_PERSON:
         return
     
     glPushMatrix()
-    glTranslatef(player_x, player_y, 0)
-    glRotatef(gun_angle, 0, 0, 1)
-    
-    q = gluNewQuadric()
-
-    glColor3f(0.3, 0.3, 0.8)
-    gluCylinder(q, 15, 15, 40, 10, 10)
-    
-    glPushMatrix()
-    glTranslatef(0, 0, 40)
-    glColor3f(0.9, 0.7, 0.6)
-    gluSphere(q, 18, 12, 12)
-    glPopMatrix()
-    
-    glPushMatrix()
-    glTranslatef(0, 0, 55)
-    glColor3f(0.2, 0.2, 0.6)
-    gluCylinder(q, 17, 15, 8, 12, 1)
-    glTranslatef(0, 0, 8)
-    glBegin(GL_POLYGON)
-    for i in range(12):
-        angle = (i / 12) * 2 * math.pi
-        glVertex3f(15 * math.cos(angle), 15 * math.sin(angle), 0)
-    glEnd()
-    glPopMatrix()
-
-    glPushMatrix()
-    glTranslatef(0, 0, 40)
-    glColor3f(0.4, 0.4, 0.7)
-    glPushMatrix()
-    glTranslatef(-20, 0, 0)
-    glRotatef(90, 0, 1, 0)
-    gluCylinder(q, 4, 4, 10, 8, 1)
-    glPopMatrix()
-    glPushMatrix()
-    glTranslatef(20, 0, 0)
-    glRotatef(-90, 0, 1, 0)
-    gluCylinder(q, 4, 4, 10, 8, 1)
-    glPopMatrix()
-    glPopMatrix()
-
-    glPushMatrix()
-    glTranslatef(0, 0, 50)
-    glColor3f(0.2, 0.2, 0.2)
-    glRotatef(90, 0, 1, 0)
-    gluCylinder(q, 5, 5, GUN_LENGTH, 10, 10)
-    glTranslatef(0, 0, GUN_LENGTH)
-    glColor3f(0.5, 0.5, 0.5)
-    glutSolidCube(8)
+    glTranslatef(frame_state.player_x, frame_state.player_y, 0)
+    glRotatef(frame_state.gun_angle, 0, 0, 1)
+    draw_model('turret')
     glPopMatrix()
 
-    glPopMatrix()
+def model_turret(out, detail):
+    out.color(0.3, 0.3, 0.8)
+    out.cylinder(15, 15, 40, tess(10, detail), tess(10, detail, 1))
+    
+    out.push()
+    out.translate(0, 0, 40)
+    out.color(0.9, 0.7, 0.6)
+    out.sphere(18, tess(12, detail), tess(12, detail))
+    out.pop()
+    
+    out.push()
+    out.translate(0, 0, 55)
+    out.color(0.2, 0.2, 0.6)
+    out.cylinder(17, 15, 8, tess(12, detail), 1)
+    out.translate(0, 0, 8)
+    out.polygon([(15 * math.cos(i / 12 * 2 * math.pi), 15 * math.sin(i / 12 * 2 * math.pi), 0) for i in range(12)])
+    out.pop()
+
+    out.push()
+    out.translate(0, 0, 40)
+    out.color(0.4, 0.4, 0.7)
+    out.push()
+    out.translate(-20, 0, 0)
+    out.rotate(90, 0, 1, 0)
+    out.cylinder(4, 4, 10, tess(8, detail), 1)
+    out.pop()
+    out.push()
+    out.translate(20, 0, 0)
+    out.rotate(-90, 0, 1, 0)
+    out.cylinder(4, 4, 10, tess(8, detail), 1)
+    out.pop()
+    out.pop()
+
+    out.push()
+    out.translate(0, 0, 50)
+    out.color(0.2, 0.2, 0.2)
+    out.rotate(90, 0, 1, 0)
+    out.cylinder(5, 5, GUN_LENGTH, tess(10, detail), tess(10, detail, 1))
+    out.translate(0, 0, GUN_LENGTH)
+    out.color(0.5, 0.5, 0.5)
+    out.cube(8)
+    out.pop()
+
+def lerp_position(e):
+    # e[10], e[11] hold where the enemy was at the start of the last tick
+    return e[10] + (e[0] - e[10]) * render_alpha, e[11] + (e[1] - e[11]) * render_alpha
 
 def draw_enemy(enemy, pulse):
-    x, y, z, etype = enemy[0], enemy[1], enemy[2], enemy[3]
+    (x, y), z, etype = lerp_position(enemy), enemy[2], enemy[3]
     hp, max_hp = enemy[4], enemy[5]
     
     glPushMatrix()
     glTranslatef(x, y, 0)
     
     if etype != 3:
-        glRotatef(math.degrees(math.atan2(player_y - y, player_x - x)), 0, 0, 1)
+        glRotatef(math.degrees(math.atan2(frame_state.player_y - y, frame_state.player_x - x)), 0, 0, 1)
     
     pulse_scale = 1 + 0.1 * sin_approx(pulse)
     glScalef(pulse_scale, pulse_scale, pulse_scale)
     
     hp_ratio = hp / max_hp
     
+    enemy[12] = detail = lod_level(projected_pixels(x, y, ENEMY_CULL_Z, ENEMY_LOD_RADIUS), enemy[12])
     if etype == 1:
-        draw_tank(hp_ratio)
+        draw_model('tank', hp_ratio, detail)
     elif etype in (0, 2, 3):
-        draw_soldier(etype, hp_ratio)
+        draw_model('soldier%d' % etype, hp_ratio, detail)
     elif etype == 4:
-        glPushMatrix()
-        glTranslatef(0, 0, 30)
-        glColor3f(1.0 * hp_ratio, 0.0, 1.0 * hp_ratio)
-        glScalef(1.5, 1.5, 1.5)
-        glutSolidCube(25)
-        glPopMatrix()
+        draw_model('kamikaze', hp_ratio, detail)
     
     glPopMatrix()
 
+def model_kamikaze(out, detail):
+    out.push()
+    out.translate(0, 0, 30)
+    out.color(1.0, 0.0, 1.0, tinted=True)
+    out.scale(1.5, 1.5, 1.5)
+    out.cube(25)
+    out.pop()
+
 def draw_bullet(b):
     kind = b[6]
-    if kind in ("normal", "burst"):
-        x, y, z = b[0], b[1], b[2]
+    lag = 1.0 - render_alpha
+    if kind in (BULLET_NORMAL, BULLET_BURST):
+        x, y, z = b[0] - b[3] * lag, b[1] - b[4] * lag, b[2]
         glPushMatrix()
         glTranslatef(x, y, z)
-        glColor3f(1, 1, 0)
-        glutSolidCube(5)
+        draw_model('bullet')
         glPopMatrix()
-    elif kind == "shockwave":
-        radius = b[7]
+    elif kind == BULLET_SHOCKWAVE:
+        radius = max(0.0, b[7] - 20 * lag)
         x, y = b[0], b[1]
         glPushMatrix()
         glTranslatef(x, y, 2.0)
-        glColor3f(1.0, 0.7, 0.2)
-        glBegin(GL_LINE_LOOP)
-        for i in range(32):
-            angle = (6.28 * i) / 32
-            glVertex3f(radius * math.cos(angle), radius * math.sin(angle), 0)
-        glEnd()
+        glScalef(radius, radius, 1)
+        draw_model('ring')
         glPopMatrix()
 
+def model_bullet(out, detail):
+    out.color(1, 1, 0)
+    out.cube(5)
+
+def model_ring(out, detail):
+    out.color(1.0, 0.7, 0.2)
+    out.line_loop([(math.cos(6.28 * i / 32), math.sin(6.28 * i / 32), 0) for i in range(32)])
+
+ENEMY_BULLET_COLORS = {0: (1.0, 0.2, 0.2), 1: (1.0, 0.5, 0.0), 2: (0.1, 1.0, 0.1), 3: (1.0, 1.0, 0.0)}
+
 def draw_enemy_bullet(b):
-    x, y, z, etype = b[0], b[1], b[2], b[6]
-    colors = {0: (1.0, 0.2, 0.2), 1: (1.0, 0.5, 0.0), 2: (0.1, 1.0, 0.1), 3: (1.0, 1.0, 0.0)}
-    color = colors.get(etype, (1.0, 1.0, 1.0))
+    lag = 1.0 - render_alpha
+    x, y, z, etype = b[0] - b[3] * lag, b[1] - b[4] * lag, b[2], b[6]
     glPushMatrix()
     glTranslatef(x, y, z)
-    glColor3f(color[0], color[1], color[2])
-    q = gluNewQuadric()
-    gluSphere(q, 4, 6, 6)
+    detail = lod_level(projected_pixels(x, y, z, 4.0), 0)
+    draw_model('enemy_bullet%d' % etype if etype in ENEMY_BULLET_COLORS else 'enemy_bullet', 1.0, detail)
     glPopMatrix()
 
-def draw_soldier(etype, hp_ratio):
+def model_enemy_bullet(etype, out, detail):
+    out.color(*ENEMY_BULLET_COLORS.get(etype, (1.0, 1.0, 1.0)))
+    out.sphere(4, tess(6, detail), tess(6, detail))
+
+def model_soldier(etype, out, detail):
     if etype == 0:
-        uniform_color = [1.0 * hp_ratio, 0.2 * hp_ratio, 0.2 * hp_ratio]
+        uniform_color = [1.0, 0.2, 0.2]
     elif etype == 2:
-        uniform_color = [0.9 * hp_ratio, 0.7 * hp_ratio, 0.1 * hp_ratio]
+        uniform_color = [0.9, 0.7, 0.1]
     else:
-        uniform_color = [0.6 * hp_ratio, 0.6 * hp_ratio, 1.0 * hp_ratio]
-    
-    glRotatef(-90, 0, 0, 1)
-    
-    glPushMatrix()
-    glColor3f(uniform_color[0], uniform_color[1], uniform_color[2])
-    glScalef(0.6, 1.0, 0.5)
-    glTranslatef(0, 0, 45)
-    glutSolidCube(25)
-    glPopMatrix()
-    
-    glPushMatrix()
-    glColor3f(0.3 * hp_ratio, 0.35 * hp_ratio, 0.3 * hp_ratio)
-    glTranslatef(0, 13, 45)
-    glScalef(0.7, 0.2, 0.8)
-    glutSolidCube(20)
-    glPopMatrix()
-    
-    glPushMatrix()
-    glColor3f(0.25 * hp_ratio, 0.3 * hp_ratio, 0.25 * hp_ratio)
-    glTranslatef(0, 0, 68)
-    q = gluNewQuadric()
-    gluSphere(q, 12, 10, 10)
-    glPopMatrix()
-    
-    glPushMatrix()
-    glColor3f(0.9, 0.7, 0.6)
-    glTranslatef(0, 7, 66)
-    glScalef(0.9, 0.7, 0.6)
-    gluSphere(q, 10, 10, 10)
-    glPopMatrix()
+        uniform_color = [0.6, 0.6, 1.0]
+    
+    out.rotate(-90, 0, 0, 1)
+    
+    out.push()
+    out.color(uniform_color[0], uniform_color[1], uniform_color[2], tinted=True)
+    out.scale(0.6, 1.0, 0.5)
+    out.translate(0, 0, 45)
+    out.cube(25)
+    out.pop()
+    
+    out.push()
+    out.color(0.3, 0.35, 0.3, tinted=True)
+    out.translate(0, 13, 45)
+    out.scale(0.7, 0.2, 0.8)
+    out.cube(20)
+    out.pop()
+    
+    out.push()
+    out.color(0.25, 0.3, 0.25, tinted=True)
+    out.translate(0, 0, 68)
+    out.sphere(12, tess(10, detail), tess(10, detail))
+    out.pop()
+    
+    out.push()
+    out.color(0.9, 0.7, 0.6)
+    out.translate(0, 7, 66)
+    out.scale(0.9, 0.7, 0.6)
+    out.sphere(10, tess(10, detail), tess(10, detail))
+    out.pop()
     
     for i in [-1, 1]:
-        glPushMatrix()
-        glColor3f(uniform_color[0], uniform_color[1], uniform_color[2])
-        glTranslatef(i * 8, 0, 20)
-        glScalef(0.5, 0.5, 1.5)
-        glutSolidCube(20)
-        glColor3f(0.2 * hp_ratio, 0.2 * hp_ratio, 0.2 * hp_ratio)
-        glTranslatef(0, 0, -12)
-        glScalef(1.2, 1.2, 0.4)
-        glutSolidCube(20)
-        glPopMatrix()
+        out.push()
+        out.color(uniform_color[0], uniform_color[1], uniform_color[2], tinted=True)
+        out.translate(i * 8, 0, 20)
+        out.scale(0.5, 0.5, 1.5)
+        out.cube(20)
+        out.color(0.2, 0.2, 0.2, tinted=True)
+        out.translate(0, 0, -12)
+        out.scale(1.2, 1.2, 0.4)
+        out.cube(20)
+        out.pop()
     
     if etype == 3:
-        glPushMatrix()
-        glColor3f(0.1, 0.1, 0.1)
-        glTranslatef(15, 20, 45)
-        glRotatef(90, 0, 1, 0)
-        glRotatef(-15, 1, 0, 0)
-        q = gluNewQuadric()
-        gluCylinder(q, 2, 2, 50, 6, 1)
-        glTranslatef(0, 0, -5)
-        glScalef(1, 1, 1.5)
-        glutSolidCube(6)
-        glPopMatrix()
+        out.push()
+        out.color(0.1, 0.1, 0.1)
+        out.translate(15, 20, 45)
+        out.rotate(90, 0, 1, 0)
+        out.rotate(-15, 1, 0, 0)
+        out.cylinder(2, 2, 50, tess(6, detail), 1)
+        out.translate(0, 0, -5)
+        out.scale(1, 1, 1.5)
+        out.cube(6)
+        out.pop()
 
 def draw_enemy_health_bar(enemy):
-    x, y, z, etype, hp, max_hp = enemy[0], enemy[1], enemy[2], enemy[3], enemy[4], enemy[5]
+    z, etype, hp, max_hp = enemy[2], enemy[3], enemy[4], enemy[5]
     if hp >= max_hp:
         return
+    x, y = lerp_position(enemy)
     
     glPushMatrix()
     
@@ -518,84 +1829,78 @@ def draw_enemy_health_bar(enemy):
     
     glPopMatrix()
 
-def draw_tank(hp_ratio):
-    main_color = [1.0 * hp_ratio, 1.0 * hp_ratio, 1.0 * hp_ratio]
-    track_color = [0.2 * hp_ratio, 0.2 * hp_ratio, 0.2 * hp_ratio]
+def model_tank(out, detail):
+    out.rotate(-90, 0, 0, 1)
     
-    glRotatef(-90, 0, 0, 1)
-    
-    glPushMatrix()
-    glColor3f(main_color[0], main_color[1], main_color[2])
-    glTranslatef(0, 0, 20)
-    glScalef(1.0, 1.8, 0.5)
-    glutSolidCube(40)
-    glPopMatrix()
+    out.push()
+    out.color(1.0, 1.0, 1.0, tinted=True)
+    out.translate(0, 0, 20)
+    out.scale(1.0, 1.8, 0.5)
+    out.cube(40)
+    out.pop()
     
     for i in [-1, 1]:
-        glPushMatrix()
-        glColor3f(track_color[0], track_color[1], track_color[2])
-        glTranslatef(i * 25, 0, 15)
-        glScalef(0.3, 2.0, 0.6)
-        glutSolidCube(40)
-        glPopMatrix()
-    
-    glPushMatrix()
-    glColor3f(main_color[0], main_color[1], main_color[2])
-    glTranslatef(0, 0, 45)
-    q = gluNewQuadric()
-    gluCylinder(q, 18, 18, 12, 15, 5)
-    glTranslatef(0, 0, 12)
-    glBegin(GL_POLYGON)
-    for i in range(15):
-        angle = (6.28 * i) / 15
-        glVertex3f(18 * math.cos(angle), 18 * math.sin(angle), 0)
-    glEnd()
-    glPopMatrix()
-    
-    glPushMatrix()
-    glColor3f(track_color[0], track_color[1], track_color[2])
-    glTranslatef(0, 20, 50)
-    gluCylinder(q, 4, 3, 70, 8, 2)
-    glPopMatrix()
-
-
-#LOGIC
+        out.push()
+        out.color(0.2, 0.2, 0.2, tinted=True)
+        out.translate(i * 25, 0, 15)
+        out.scale(0.3, 2.0, 0.6)
+        out.cube(40)
+        out.pop()
+    
+    out.push()
+    out.color(1.0, 1.0, 1.0, tinted=True)
+    out.translate(0, 0, 45)
+    out.cylinder(18, 18, 12, tess(15, detail), tess(5, detail, 1))
+    out.translate(0, 0, 12)
+    out.polygon([(18 * math.cos(6.28 * i / 15), 18 * math.sin(6.28 * i / 15), 0) for i in range(15)])
+    out.pop()
+    
+    out.push()
+    out.color(0.2, 0.2, 0.2, tinted=True)
+    out.translate(0, 20, 50)
+    out.cylinder(4, 3, 70, tess(8, detail), tess(2, detail, 1))
+    out.pop()
+
+MODELS = {
+    'tree': model_tree,
+    'turret': model_turret,
+    'booster': model_booster,
+    'tank': model_tank,
+    'kamikaze': model_kamikaze,
+    'bullet': model_bullet,
+    'ring': model_ring,
+    'enemy_bullet': partial(model_enemy_bullet, None),
+}
+for _etype in (0, 2, 3):
+    MODELS['soldier%d' % _etype] = partial(model_soldier, _etype)
+for _etype in ENEMY_BULLET_COLORS:
+    MODELS['enemy_bullet%d' % _etype] = partial(model_enemy_bullet, _etype)
 
 def move_health_booster():
-    while True:
-        angle = random.uniform(0, 2 * math.pi)
-        dist = random.uniform(300, GRID_LENGTH - 200)
-        bx = dist * math.cos(angle)
-        by = dist * math.sin(angle)
-        valid = True
-        for tx, ty, _ in tree_positions:
-            if math.hypot(bx - tx, by - ty) < TREE_RADIUS + health_booster_pos['radius']:
-                valid = False
-                break
-        if valid:
-            health_booster_pos['x'] = bx
-            health_booster_pos['y'] = by
-            break
+    points = spawn_table('booster')
+    if points:
+        health_booster_pos['x'], health_booster_pos['y'] = random.choice(points)
 
 def is_gun_tip_valid(gun_tip_x, gun_tip_y):
     if not (-GRID_LENGTH + 5 < gun_tip_x < GRID_LENGTH - 5 and -GRID_LENGTH + 5 < gun_tip_y < GRID_LENGTH - 5):
         return False
-    for tx, ty, _ in tree_positions:
+    for tx, ty, _ in trees_near(gun_tip_x, gun_tip_y, TREE_RADIUS):
         if math.hypot(gun_tip_x - tx, gun_tip_y - ty) < TREE_RADIUS:
             return False
-    for e in enemies:
+    for i in enemies_near(gun_tip_x, gun_tip_y, 0):
+        e = enemies[i]
         if math.hypot(gun_tip_x - e[0], gun_tip_y - e[1]) < ENEMY_STATS[e[3]]['radius']:
             return False
     return True
 
 def is_position_valid_for_player(x, y):
-    for tx, ty, _ in tree_positions:
+    for tx, ty, _ in trees_near(x, y, player_radius + TREE_RADIUS):
         if math.hypot(x - tx, y - ty) < player_radius + TREE_RADIUS:
             return False
     return -GRID_LENGTH + player_radius < x < GRID_LENGTH - player_radius and -GRID_LENGTH + player_radius < y < GRID_LENGTH - player_radius
 
 def is_position_valid_for_enemy_static(x, y, radius):
-    for tx, ty, _ in tree_positions:
+    for tx, ty, _ in trees_near(x, y, radius + TREE_RADIUS):
         if math.hypot(x - tx, y - ty) < radius + TREE_RADIUS:
             return False
     return -GRID_LENGTH + radius < x < GRID_LENGTH - radius and -GRID_LENGTH + radius < y < GRID_LENGTH - radius
@@ -645,35 +1950,27 @@ def split_enemy(enemy):
         stats = ENEMY_STATS[0]
         off_x = random.uniform(-30, 30)
         off_y = random.uniform(-30, 30)
-        new_hp = stats["hp"] * (1 + difficulty * 0.1)
-        new_speed = stats["speed"] * (1 + difficulty * 0.05)
-        enemies.append([x + off_x, y + off_y, 0, 0, new_hp, new_hp, new_speed, 0, stats["fire_rate"], 0, 0, 0])
+        new_hp = stats["hp"] * (1 + difficulty * SPLIT_HP_SCALE)
+        new_speed = stats["speed"] * (1 + difficulty * SPLIT_SPEED_SCALE)
+        new_x, new_y = x + off_x, y + off_y
+        enemies.append([new_x, new_y, 0, 0, new_hp, new_hp, new_speed, 0, stats["fire_rate"], 0, new_x, new_y, 0, sim_tick])
 
 def manage_enemy_spawning():
     global difficulty
     difficulty = score // 30
-    max_enemies = 8 + difficulty * 2
+    max_enemies = int((8 + difficulty * 2) * enemy_cap_scale)
     
     if len(enemies) < max_enemies:
         etype = random.choices([0, 1, 2, 3, 4], weights=[10, 2, 4, 1, 8], k=1)[0]
         stat = ENEMY_STATS[etype]
+        points = spawn_table('sniper' if etype == 3 else 'edge', stat['radius'])
+        if not points:
+            return
+        spawn_x, spawn_y = random.choice(points)
         
-        while True:
-            angle = random.uniform(0, 2 * math.pi)
-            spawn_dist = GRID_LENGTH - stat['radius'] - 100
-            spawn_x = spawn_dist * math.cos(angle)
-            spawn_y = spawn_dist * math.sin(angle)
-            
-            if is_position_valid_for_enemy_static(spawn_x, spawn_y, stat['radius']):
-                if etype == 3:
-                    if check_line_of_sight((spawn_x, spawn_y), (0, 0)):
-                        break
-                else:
-                    break
-        
-        hp = stat["hp"] * (1 + difficulty * 0.15)
-        speed = stat["speed"] * (1 + difficulty * 0.08)
-        enemies.append([spawn_x, spawn_y, 0, etype, hp, hp, speed, 0, random.randint(0, stat["fire_rate"]), 0, 0, 0])
+        hp = stat["hp"] * (1 + difficulty * DIFFICULTY_HP_SCALE)
+        speed = stat["speed"] * (1 + difficulty * DIFFICULTY_SPEED_SCALE)
+        enemies.append([spawn_x, spawn_y, 0, etype, hp, hp, speed, 0, random.randint(0, stat["fire_rate"]), 0, spawn_x, spawn_y, 0, sim_tick])
 
 def initial_spawn():
     enemies.clear()
@@ -682,35 +1979,58 @@ def initial_spawn():
     for etype, count in spawn_types.items():
         for i in range(count):
             stat = ENEMY_STATS[etype]
-            while True:
-                angle = random.uniform(0, 2 * math.pi)
-                spawn_dist = random.uniform(GRID_LENGTH - 600, GRID_LENGTH - 200)
-                spawn_x = spawn_dist * math.cos(angle)
-                spawn_y = spawn_dist * math.sin(angle)
-                if is_position_valid_for_enemy_static(spawn_x, spawn_y, stat['radius']):
-                    break
-            enemies.append([spawn_x, spawn_y, 0, etype, stat['hp'], stat['hp'], stat['speed'], 0, random.randint(0, stat["fire_rate"]), 0, 0, 0])
+            points = spawn_table('initial', stat['radius'])
+            if not points:
+                break
+            spawn_x, spawn_y = random.choice(points)
+            # staggered so the opening wave does not share its AI ticks; the
+            # phases reach forward, so a first run never catches up on ticks
+            # from before the spawn
+            last_ai = sim_tick + len(enemies) % AI_FAR_INTERVAL
+            enemies.append([spawn_x, spawn_y, 0, etype, stat['hp'], stat['hp'], stat['speed'], 0, random.randint(0, stat["fire_rate"]), 0, spawn_x, spawn_y, 0, last_ai])
+    rebuild_enemy_grid()
+
+# AI SCHEDULING
+# Steering, the kamikaze check and firing run on an enemy's AI ticks only: every
+# tick within AI_BANDS[0][0] of the player, every second tick further out and
+# every AI_FAR_INTERVAL-th beyond that. e[13] is the tick its AI last ran, and a
+# run catches up on everything since: it moves speed * elapsed and counts the
+# fire timer down by elapsed. Enemies spawned on different ticks fall into
+# different phases, which spreads the far ones round-robin over the ticks. A
+# fire timer that runs out between AI ticks pulls the next run forward to that
+# tick, so shots keep their timing; an enemy still waiting for a line of sight
+# retries on its AI ticks. Stunned enemies neither run nor owe AI time.
+
+AI_BANDS = ((600.0, 1), (1200.0, 2))    # (distance to the player, AI every N ticks)
+AI_FAR_INTERVAL = 4
+
+def ai_interval(dist):
+    for limit, interval in AI_BANDS:
+        if dist < limit:
+            return interval
+    return AI_FAR_INTERVAL
+
+def ai_intervals(dist):
+    return np.select([dist < limit for limit, _ in AI_BANDS], [interval for _, interval in AI_BANDS], AI_FAR_INTERVAL)
 
 def update_enemies():
     global score, player_hp
     
+    advance_flow_fields()
+    if soa_backend:
+        return update_enemies_soa()
+    
     for i, e in enumerate(enemies):
         if e[4] <= 0:
-            etype = e[3]
-            if etype == 1:
-                score += 30
-            elif etype == 2:
-                score += 15
+            score += ENEMY_KILL_SCORE[e[3]]
+            if e[3] == 2:
                 split_enemy(e)
-            elif etype == 4:
-                score += 10
-            else:
-                score += 5
             enemies.pop(i)
             continue
         
         if e[7] > 0:
             e[7] -= 1
+            e[13] = sim_tick
             continue
         
         if e[9] > 0:
@@ -721,6 +2041,11 @@ def update_enemies():
         dy = player_y - e[1]
         dist_to_player = math.hypot(dx, dy) if math.hypot(dx, dy) > 0 else 0.01
         
+        elapsed = sim_tick - e[13]
+        if elapsed < ai_interval(dist_to_player) and not 0 < e[8] <= elapsed:
+            continue
+        e[13] = sim_tick
+        
         #Kamikaze can touch and explode on player
         if e[3] == 4 and dist_to_player < stats['radius'] + player_radius + 10:
             player_hp -= stats['kamikaze_damage']
@@ -729,7 +2054,7 @@ def update_enemies():
         
         # Smart pathfinding - enemies stop at stop_dist
         if stats["speed"] > 0 and dist_to_player > stats["stop_dist"]:
-            base_speed = e[6]
+            base_speed = e[6] * elapsed
             
             norm_dx = dx / dist_to_player
             norm_dy = dy / dist_to_player
@@ -746,6 +2071,10 @@ def update_enemies():
                 (-norm_dx, -norm_dy, "backward")
             ]
             
+            flow = flow_direction(e[0], e[1], stats['radius'])
+            if flow is not None:
+                directions.insert(0, (flow[0], flow[1], "flow"))
+            
             for dir_x, dir_y, dir_name in directions:
                 test_x = e[0] + dir_x * base_speed
                 test_y = e[1] + dir_y * base_speed
@@ -756,16 +2085,77 @@ def update_enemies():
                     break
         
         # Firing logic
-        e[8] -= 1
-        if e[8] <= 0 and stats['fire_rate'] < 9000 and check_line_of_sight((e[0], e[1]), (player_x, player_y)):
+        e[8] -= elapsed
+        if (e[8] <= 0 and stats['fire_rate'] < 9000 and len(enemy_bullets) < enemy_projectile_cap
+                and enemy_sees_player(e[0], e[1])):
             e[8] = stats["fire_rate"]
             b_vx = (dx / dist_to_player) * stats["bullet_speed"]
             b_vy = (dy / dist_to_player) * stats["bullet_speed"]
             enemy_bullets.append([e[0], e[1], 30.0, b_vx, b_vy, stats["bullet_damage"], e[3]])
 
+def enemy_pair_candidates(grid, i, x, y, reach):
+    return sorted(j for j in grid_query(grid, x - reach, y - reach, x + reach, y + reach) if j > i)
+
+def regrid_enemy(grid, cells, k, x, y):
+    key = cell_of(x, y)
+    if key != cells[k]:
+        grid[cells[k]].remove(k)
+        grid.setdefault(key, []).append(k)
+        cells[k] = key
+
+def separate_enemy_pairs(bodies):
+    # Broad phase: a cell grid that follows every push, so row i only visits
+    # nearby j > i, in the same order as testing every pair with a double loop.
+    grid, cells = {}, []
+    for k, e in enumerate(bodies):
+        key = cell_of(e[0], e[1])
+        cells.append(key)
+        grid.setdefault(key, []).append(k)
+    
+    for i, e1 in enumerate(bodies):
+        x, y = e1[0], e1[1]
+        base_reach = ENEMY_STATS[e1[3]]['radius'] + MAX_ENEMY_RADIUS
+        slack = BROADPHASE_MARGIN
+        candidates = enemy_pair_candidates(grid, i, x, y, base_reach + slack)
+        row_moved = 0.0
+        k = 0
+        while k < len(candidates):
+            j = candidates[k]
+            k += 1
+            push_amount = separate_enemies(e1, bodies[j])
+            if push_amount:
+                regrid_enemy(grid, cells, j, bodies[j][0], bodies[j][1])
+                row_moved += push_amount
+                if row_moved > slack:
+                    # e1 was pushed out of the area we queried; widen it for the rest of the row
+                    slack = max(2 * slack, row_moved + BROADPHASE_MARGIN)
+                    candidates = enemy_pair_candidates(grid, j, x, y, base_reach + slack)
+                    k = 0
+
+def separate_enemies(e1, e2):
+    e1_stats = ENEMY_STATS[e1[3]]
+    e2_stats = ENEMY_STATS[e2[3]]
+    dist = math.hypot(e1[0] - e2[0], e1[1] - e2[1])
+    min_dist = e1_stats['radius'] + e2_stats['radius']
+    
+    if dist > 0 and dist < min_dist:
+        overlap = min_dist - dist
+        dx = (e1[0] - e2[0]) / dist
+        dy = (e1[1] - e2[1]) / dist
+        push_amount = overlap * 0.51
+        e1[0] += dx * push_amount
+        e1[1] += dy * push_amount
+        e2[0] -= dx * push_amount
+        e2[1] -= dy * push_amount
+        return push_amount
+    return 0.0
+
 def resolve_collisions():
     global player_x, player_y
     
+    if soa_backend:
+        return resolve_collisions_soa()
+    
     for e in enemies:
         e_stats = ENEMY_STATS[e[3]]
         dist = math.hypot(player_x - e[0], player_y - e[1])
@@ -781,23 +2171,7 @@ def resolve_collisions():
             e[0] -= dx * push_amount
             e[1] -= dy * push_amount
     
-    for i in range(len(enemies)):
-        for j in range(i + 1, len(enemies)):
-            e1, e2 = enemies[i], enemies[j]
-            e1_stats = ENEMY_STATS[e1[3]]
-            e2_stats = ENEMY_STATS[e2[3]]
-            dist = math.hypot(e1[0] - e2[0], e1[1] - e2[1])
-            min_dist = e1_stats['radius'] + e2_stats['radius']
-            
-            if dist > 0 and dist < min_dist:
-                overlap = min_dist - dist
-                dx = (e1[0] - e2[0]) / dist
-                dy = (e1[1] - e2[1]) / dist
-                push_amount = overlap * 0.51
-                e1[0] += dx * push_amount
-                e1[1] += dy * push_amount
-                e2[0] -= dx * push_amount
-                e2[1] -= dy * push_amount
+    separate_enemy_pairs(enemies)
 
 def update_game():
     global game_state, laser_beam_active, player_hp
@@ -811,9 +2185,14 @@ def update_game():
         player_hp = PLAYER_MAX_HP
         move_health_booster()
     
+    start = time.perf_counter()
     update_enemies()
+    profile_add('update_enemies', start)
+    start = time.perf_counter()
     resolve_collisions()
+    profile_add('resolve_collisions', start)
     manage_enemy_spawning()
+    rebuild_enemy_grid()
     
     laser_beam_active = False
     if current_weapon == WEAPON_LASER and mouse_state[GLUT_LEFT_BUTTON] == GLUT_DOWN:
@@ -832,13 +2211,13 @@ def shoot_weapon():
     start_y = player_y + sin_a * GUN_LENGTH
     
     if current_weapon == WEAPON_NORMAL:
-        bullets.append([start_x, start_y, 50.0, bullet_speed * cos_a, bullet_speed * sin_a, True, "normal"])
+        bullets.append([start_x, start_y, 50.0, bullet_speed * cos_a, bullet_speed * sin_a, True, BULLET_NORMAL])
         fire_cooldown = FIRE_CD_NORMAL
     elif current_weapon == WEAPON_BURST:
         burst_remaining = 3
         fire_cooldown = FIRE_CD_BURST
     elif current_weapon == WEAPON_SHOCKWAVE:
-        bullets.append([player_x, player_y, 0.0, 0, 0, True, "shockwave", 0.0])
+        bullets.append([player_x, player_y, 0.0, 0, 0, True, BULLET_SHOCKWAVE, 0.0])
         fire_cooldown = FIRE_CD_SHOCKWAVE
 
 def handle_laser():
@@ -876,44 +2255,65 @@ def handle_laser():
         hit_enemy[4] -= WEAPON_STATS[WEAPON_LASER]["damage"]
         laser_target_pos = (hit_enemy[0], hit_enemy[1], 50)
 
+# SHOCKWAVE RING
+# A wave damages an enemy when its front sweeps over the enemy's centre: outside
+# the previous radius at the start of the tick, inside the new radius now. The
+# front moves 20 units a tick, faster than any enemy, so every enemy is crossed
+# once per wave.
+
+def enemy_sweep_columns():
+    # current and start-of-tick enemy positions
+    cols = entity_columns(enemies, 12)
+    return cols[0], cols[1], cols[10], cols[11]
+
+def ring_crossed(columns, x, y, inner, outer):
+    ex, ey, px, py = columns
+    return (np.hypot(px - x, py - y) >= inner) & (np.hypot(ex - x, ey - y) < outer)
+
+def ring_crossings(x, y, inner, outer, columns=None):
+    # indices of the enemies the ring front crossed this tick
+    if columns is not None:
+        return np.flatnonzero(ring_crossed(columns, x, y, inner, outer)).tolist()
+    return [i for i, e in enumerate(enemies)
+            if math.hypot(e[10] - x, e[11] - y) >= inner and math.hypot(e[0] - x, e[1] - y) < outer]
+
 def update_bullets():
     global bullets
+    if soa_backend:
+        return update_bullets_soa()
     new_bullets = []
+    columns = None
     
     for b in bullets:
         kind = b[6]
         
-        if kind in ("normal", "burst"):
+        if kind in (BULLET_NORMAL, BULLET_BURST):
             x, y, z, vx, vy = b[0], b[1], b[2], b[3], b[4]
-            x += vx
-            y += vy
+            hit = first_enemy_on_segment(x, y, x + vx, y + vy)
+            blocked = segment_tree_t(x, y, x + vx, y + vy)
             
-            if not (-GRID_LENGTH < x < GRID_LENGTH and -GRID_LENGTH < y < GRID_LENGTH):
+            if blocked is not None and (hit is None or blocked <= hit[0]):
                 continue
             
-            if not check_line_of_sight((x - vx, y - vy), (x, y)):
+            if hit is not None:
+                damage = WEAPON_STATS[WEAPON_BURST if kind == BULLET_BURST else WEAPON_NORMAL]["damage"]
+                enemies[hit[1]][4] -= damage
                 continue
             
-            hit = False
-            for enemy in enemies:
-                if math.hypot(x - enemy[0], y - enemy[1]) < ENEMY_STATS[enemy[3]]['radius']:
-                    hit = True
-                    damage = WEAPON_STATS[WEAPON_BURST if kind == "burst" else WEAPON_NORMAL]["damage"]
-                    enemy[4] -= damage
-                    break
-            
-            if not hit:
+            x += vx
+            y += vy
+            if -GRID_LENGTH < x < GRID_LENGTH and -GRID_LENGTH < y < GRID_LENGTH:
                 new_bullets.append([x, y, z, vx, vy, True, kind])
         
-        elif kind == "shockwave":
+        elif kind == BULLET_SHOCKWAVE:
             x, y, z, radius = b[0], b[1], b[2], b[7]
             radius += 20
             
             if radius < 600:
-                if int(radius) % 20 == 0:
-                    for e in enemies:
-                        if abs(math.hypot(e[0] - x, e[1] - y) - radius) < 20:
-                            e[4] -= WEAPON_STATS[WEAPON_SHOCKWAVE]["damage"]
+                if columns is None and np is not None:
+                    columns = enemy_sweep_columns()
+                for i in ring_crossings(x, y, radius - 20, radius, columns):
+                    enemies[i][4] -= WEAPON_STATS[WEAPON_SHOCKWAVE]["damage"]
                 new_bullets.append([x, y, z, 0, 0, True, kind, radius])
     
     bullets[:] = new_bullets
@@ -921,61 +2321,710 @@ def update_bullets():
 def update_enemy_bullets():
     global player_hp
     
+    if soa_backend:
+        return update_enemy_bullets_soa()
+    
     for b in enemy_bullets[:]:
-        if not check_line_of_sight((b[0], b[1]), (b[0] + b[3], b[1] + b[4])):
+        hit = segment_circle_t(b[0], b[1], b[3], b[4], player_x, player_y, player_radius)
+        blocked = segment_tree_t(b[0], b[1], b[0] + b[3], b[1] + b[4])
+        
+        if blocked is not None and (hit is None or blocked <= hit):
             enemy_bullets.remove(b)
             continue
         
-        b[0] += b[3]
-        b[1] += b[4]
-        
-        if math.hypot(b[0] - player_x, b[1] - player_y) < player_radius:
+        if hit is not None:
             player_hp -= b[5]
             enemy_bullets.remove(b)
             continue
         
+        b[0] += b[3]
+        b[1] += b[4]
+        
         if not (-GRID_LENGTH < b[0] < GRID_LENGTH and -GRID_LENGTH < b[1] < GRID_LENGTH):
             enemy_bullets.remove(b)
 
+# SOA BACKEND
+# Opt-in (--soa): enemies, bullets and enemy_bullets become EntityStores and the
+# three update passes run as NumPy kernels. Rows handed out by indexing or
+# iteration are views into the store, so the scalar code (drawing, laser,
+# collisions, spawning) keeps working on e[0]..e[13] unchanged.
+
+class EntityStore:
+    def __init__(self, fields, rows=(), capacity=64):
+        self.data = np.zeros((fields, max(capacity, len(rows))))
+        self.count = 0
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("entity index out of range")
+        return self.data[:, i]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.data[:, i]
+
+    def column(self, field):
+        return self.data[field, :self.count]
+
+    def reserve(self, extra):
+        needed = self.count + extra
+        if needed > self.data.shape[1]:
+            grown = np.zeros((self.data.shape[0], max(needed, 2 * self.data.shape[1])))
+            grown[:, :self.count] = self.data[:, :self.count]
+            self.data = grown
+
+    def append(self, row):
+        self.reserve(1)
+        self.data[:, self.count] = 0.0
+        self.data[:len(row), self.count] = row
+        self.count += 1
+
+    def extend_columns(self, columns):
+        # columns: one equal-length sequence per field, in field order
+        added = len(columns[0])
+        if added == 0:
+            return
+        self.reserve(added)
+        block = self.data[:, self.count:self.count + added]
+        block[:] = 0.0
+        for field, values in enumerate(columns):
+            block[field] = values
+        self.count += added
+
+    def compact(self, keep):
+        # order-preserving removal of every row where keep is False
+        kept = int(np.count_nonzero(keep))
+        if kept != self.count:
+            self.data[:, :kept] = self.data[:, :self.count][:, keep]
+            self.count = kept
+
+    def pop(self, i):
+        keep = np.ones(self.count, dtype=bool)
+        keep[i] = False
+        row = self.data[:, i].copy()
+        self.compact(keep)
+        return row
+
+    def clear(self):
+        self.count = 0
+
+    def adopt(self, block):
+        # take a (fields, n) array as the storage as is; growing reallocates
+        self.data, self.count = block, block.shape[1]
+
+    def copy(self):
+        store = EntityStore(self.data.shape[0], capacity=self.count)
+        store.data[:, :self.count] = self.data[:, :self.count]
+        store.count = self.count
+        return store
+
+
+soa_backend = False
+tree_array = None         # (T + 1, 2) tree centres, last row is a far-away sentinel
+tree_cell_table = None    # per cell: every tree in its 3x3 neighbourhood, padded with the sentinel
+tree_table_origin = (0, 0)
+SOA_CHUNK = 1 << 20       # max elements in one (entities x trees/enemies) temporary
+
+def enable_soa_backend():
+    global enemies, bullets, enemy_bullets, soa_backend
+    if np is None:
+        raise RuntimeError("the SoA backend needs numpy")
+    if not soa_backend:
+        enemies = EntityStore(14, enemies)
+        bullets = EntityStore(8, bullets)
+        enemy_bullets = EntityStore(7, enemy_bullets)
+        soa_backend = True
+        clear_flow_fields()     # built as lists; the SoA kernels index them with arrays
+        pack_tree_array()
+        rebuild_enemy_grid()
+
+def pack_tree_array():
+    global tree_array, tree_cell_table, tree_table_origin
+    if np is None:
+        return
+    cx0, cy0 = cell_of(-GRID_LENGTH - CELL_SIZE, -GRID_LENGTH - CELL_SIZE)
+    cx1, cy1 = cell_of(GRID_LENGTH + CELL_SIZE, GRID_LENGTH + CELL_SIZE)
+    cells = {}
+    for k, (tx, ty, _) in enumerate(tree_positions):
+        cx, cy = cell_of(tx, ty)
+        for nx in range(cx - 1, cx + 2):
+            for ny in range(cy - 1, cy + 2):
+                cells.setdefault((nx, ny), []).append(k)
+    width = max([len(v) for v in cells.values()] + [1])
+    table = np.full((cx1 - cx0 + 1, cy1 - cy0 + 1, width), len(tree_positions), dtype=np.intp)
+    for (cx, cy), members in cells.items():
+        if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+            table[cx - cx0, cy - cy0, :len(members)] = members
+    tree_array = np.array([(tx, ty) for tx, ty, _ in tree_positions] + [(1e12, 1e12)], dtype=float)
+    tree_cell_table = table
+    tree_table_origin = (cx0, cy0)
+
+def trees_near_points(x, y):
+    # (N, K) indices into tree_array covering every tree within CELL_SIZE of each point
+    ix = np.clip(np.floor(x / CELL_SIZE).astype(np.intp) - tree_table_origin[0], 0, tree_cell_table.shape[0] - 1)
+    iy = np.clip(np.floor(y / CELL_SIZE).astype(np.intp) - tree_table_origin[1], 0, tree_cell_table.shape[1] - 1)
+    return tree_cell_table[ix, iy]
+
+def stat_column(key):
+    return np.array([ENEMY_STATS[t][key] for t in range(len(ENEMY_STATS))], dtype=float)
+
+def chunked(count, width):
+    step = max(1, SOA_CHUNK // max(1, width))
+    for start in range(0, count, step):
+        yield slice(start, min(count, start + step))
+
+def segments_circle_t(p1x, p1y, dx, dy, cx, cy, radius):
+    # segment_circle_t over broadcast arrays, inf where the segment misses
+    fx, fy = p1x - cx, p1y - cy
+    c = fx*fx + fy*fy - radius*radius
+    a = dx*dx + dy*dy
+    b = fx*dx + fy*dy
+    disc = b*b - a*c
+    t = (-b - np.sqrt(np.maximum(disc, 0))) / np.where(a == 0, 1.0, a)
+    t = np.where((a > 0) & (b < 0) & (disc > 0) & (t <= 1), t, np.inf)
+    return np.where(c < 0, 0.0, t)
+
+def segments_tree_t(p1x, p1y, p2x, p2y):
+    # segment_tree_t over arrays of segments, inf where no tree is in the way
+    p1x, p1y, p2x, p2y = (a.astype(float) for a in np.broadcast_arrays(p1x, p1y, p2x, p2y))
+    dx, dy = p2x - p1x, p2y - p1y
+    first = np.full(p1x.shape, np.inf)
+    # short segments (every projectile step) only need the trees around their start cell
+    short = dx*dx + dy*dy <= (CELL_SIZE - LOS_REACH)**2
+    idx = np.flatnonzero(short)
+    for s in chunked(len(idx), tree_cell_table.shape[2]):
+        i = idx[s]
+        near = trees_near_points(p1x[i], p1y[i])
+        first[i] = segments_circle_t(p1x[i, None], p1y[i, None], dx[i, None], dy[i, None],
+                                     tree_array[near, 0], tree_array[near, 1], LOS_REACH).min(axis=1)
+    idx = np.flatnonzero(~short)
+    for s in chunked(len(idx), len(tree_array)):
+        i = idx[s]
+        first[i] = segments_circle_t(p1x[i, None], p1y[i, None], dx[i, None], dy[i, None],
+                                     tree_array[:, 0], tree_array[:, 1], LOS_REACH).min(axis=1)
+    return first
+
+def positions_valid_for_enemies(x, y, radius):
+    # is_position_valid_for_enemy_static over arrays (radius + TREE_RADIUS < CELL_SIZE)
+    valid = (-GRID_LENGTH + radius < x) & (x < GRID_LENGTH - radius) & (-GRID_LENGTH + radius < y) & (y < GRID_LENGTH - radius)
+    for s in chunked(len(x), tree_cell_table.shape[2]):
+        near = trees_near_points(x[s], y[s])
+        blocked = (np.hypot(x[s, None] - tree_array[near, 0], y[s, None] - tree_array[near, 1]) < radius[s, None] + TREE_RADIUS).any(axis=1)
+        valid[s] &= ~blocked
+    return valid
+
+def first_enemy_swept(p1x, p1y, dx, dy, ex, ey, e_radius):
+    # (index, t) of the first enemy each segment enters, lowest index on ties,
+    # -1 and inf on a miss; only enemies inside the segment's x-extent +-MAX_ENEMY_RADIUS
+    # (found by binary search) are tested
+    order = np.argsort(ex, kind='stable')
+    sorted_x = ex[order]
+    lo = np.searchsorted(sorted_x, np.minimum(p1x, p1x + dx) - MAX_ENEMY_RADIUS, side='left')
+    hi = np.searchsorted(sorted_x, np.maximum(p1x, p1x + dx) + MAX_ENEMY_RADIUS, side='right')
+    first = np.full(len(p1x), len(ex), dtype=np.intp)
+    first_t = np.full(len(p1x), np.inf)
+    width = int((hi - lo).max()) if len(p1x) else 0
+    for s in chunked(len(p1x) if width else 0, width):
+        slot = lo[s, None] + np.arange(width)
+        cand = order[np.minimum(slot, len(ex) - 1)]
+        t = segments_circle_t(p1x[s, None], p1y[s, None], dx[s, None], dy[s, None], ex[cand], ey[cand], e_radius[cand])
+        t[slot >= hi[s, None]] = np.inf
+        first_t[s] = t.min(axis=1)
+        first[s] = np.where(np.isfinite(t) & (t == first_t[s, None]), cand, len(ex)).min(axis=1)
+    first[first == len(ex)] = -1
+    return first, first_t
+
+def flow_directions(x, y, radius):
+    # flow_direction over arrays, (0, 0) where the field has no step
+    ix = np.clip(((x + GRID_LENGTH) // FLOW_CELL).astype(np.intp), 0, FLOW_SIZE - 1)
+    iy = np.clip(((y + GRID_LENGTH) // FLOW_CELL).astype(np.intp), 0, FLOW_SIZE - 1)
+    goal = flow_cell(player_x, player_y)
+    nxt = np.full(len(x), -1, dtype=np.intp)
+    for r in np.unique(radius):
+        active = flow_active.get(flow_class(float(r)))
+        if active is not None:
+            group = radius == r
+            nxt[group] = active[1][ix[group] * FLOW_SIZE + iy[group]]
+    tx = (nxt // FLOW_SIZE + 0.5) * FLOW_CELL - GRID_LENGTH
+    ty = (nxt % FLOW_SIZE + 0.5) * FLOW_CELL - GRID_LENGTH
+    tx[nxt == goal], ty[nxt == goal] = player_x, player_y
+    dx, dy = tx - x, ty - y
+    d = np.hypot(dx, dy)
+    step = (nxt >= 0) & (d > 0)
+    d[~step] = 1.0
+    return np.where(step, dx / d, 0.0), np.where(step, dy / d, 0.0)
+
+def update_enemies_soa():
+    global score, player_hp
+    
+    n = len(enemies)
+    if n == 0:
+        return
+    x, y, etype = enemies.column(0), enemies.column(1), enemies.column(3).astype(np.intp)
+    hp, speed = enemies.column(4), enemies.column(6)
+    stun, fire_timer, contact = enemies.column(7), enemies.column(8), enemies.column(9)
+    last_ai = enemies.column(13)
+    radius = stat_column('radius')[etype]
+    
+    dead = hp <= 0
+    score += int(sum(ENEMY_KILL_SCORE[t] for t in etype[dead]))
+    splits = [(x[i], y[i]) for i in np.flatnonzero(dead & (etype == 2))]
+    
+    stunned = ~dead & (stun > 0)
+    stun[stunned] -= 1
+    last_ai[stunned] = sim_tick
+    active = ~dead & ~stunned
+    contact[active & (contact > 0)] -= 1
+    
+    dx = player_x - x
+    dy = player_y - y
+    dist = np.hypot(dx, dy)
+    dist[dist <= 0] = 0.01
+    
+    elapsed = sim_tick - last_ai
+    active &= (elapsed >= ai_intervals(dist)) | ((fire_timer > 0) & (fire_timer <= elapsed))
+    last_ai[active] = sim_tick
+    
+    boom = active & (etype == 4) & (dist < radius + player_radius + 10)
+    if boom.any():
+        player_hp -= float(stat_column('kamikaze_damage')[etype[boom]].sum())
+        hp[boom] = 0
+    active &= ~boom
+    
+    # same four probes as update_enemies: forward, left, right, backward
+    movers = np.flatnonzero(active & (stat_column('speed')[etype] > 0) & (dist > stat_column('stop_dist')[etype]))
+    if len(movers):
+        nx, ny = dx[movers] / dist[movers], dy[movers] / dist[movers]
+        step, r = speed[movers] * elapsed[movers], radius[movers]
+        fx, fy = flow_directions(x[movers], y[movers], r)
+        todo = np.flatnonzero((fx != 0) | (fy != 0))
+        test_x = x[movers[todo]] + fx[todo] * step[todo]
+        test_y = y[movers[todo]] + fy[todo] * step[todo]
+        ok = positions_valid_for_enemies(test_x, test_y, r[todo])
+        x[movers[todo[ok]]] = test_x[ok]
+        y[movers[todo[ok]]] = test_y[ok]
+        moved = np.zeros(len(movers), dtype=bool)
+        moved[todo[ok]] = True
+        for dir_x, dir_y in ((nx, ny), (-ny, nx), (ny, -nx), (-nx, -ny)):
+            todo = np.flatnonzero(~moved)
+            if len(todo) == 0:
+                break
+            test_x = x[movers[todo]] + dir_x[todo] * step[todo]
+            test_y = y[movers[todo]] + dir_y[todo] * step[todo]
+            ok = positions_valid_for_enemies(test_x, test_y, r[todo])
+            x[movers[todo[ok]]] = test_x[ok]
+            y[movers[todo[ok]]] = test_y[ok]
+            moved[todo[ok]] = True
+    
+    fire_timer[active] -= elapsed[active]
+    fire_rate = stat_column('fire_rate')[etype]
+    ready = np.flatnonzero(active & (fire_timer <= 0) & (fire_rate < 9000))
+    if len(ready):
+        ready = ready[np.fromiter((enemy_sees_player(x[i], y[i]) for i in ready), dtype=bool, count=len(ready))]
+        # as in update_enemies: only enemies that can fire take up room under the cap
+        room = enemy_projectile_cap - len(enemy_bullets)
+        if len(ready) > room:
+            ready = ready[:max(0, room)]
+        fire_timer[ready] = fire_rate[ready]
+        b_speed = stat_column('bullet_speed')[etype[ready]]
+        enemy_bullets.extend_columns((x[ready], y[ready], np.full(len(ready), 30.0),
+                                      dx[ready] / dist[ready] * b_speed, dy[ready] / dist[ready] * b_speed,
+                                      stat_column('bullet_damage')[etype[ready]], etype[ready]))
+    
+    enemies.compact(~dead)
+    for sx, sy in splits:
+        split_enemy((sx, sy))
+
+def resolve_collisions_soa():
+    # The same two order-dependent scalar passes as resolve_collisions, reading
+    # and writing the x and y columns of the store in place through memoryviews,
+    # which hand out plain floats, instead of materialising rows.
+    global player_x, player_y
+    
+    xs, ys = memoryview(enemies.column(0)), memoryview(enemies.column(1))
+    radii = memoryview(stat_column('radius')[enemies.column(3).astype(np.intp)])
+    for k in range(len(enemies)):
+        dist = math.hypot(player_x - xs[k], player_y - ys[k])
+        min_dist = player_radius + radii[k]
+        if dist > 0 and dist < min_dist:
+            dx = (player_x - xs[k]) / dist
+            dy = (player_y - ys[k]) / dist
+            push_amount = (min_dist - dist) * 0.51
+            player_x += dx * push_amount
+            player_y += dy * push_amount
+            xs[k] -= dx * push_amount
+            ys[k] -= dy * push_amount
+    
+    separate_enemy_columns(xs, ys, radii)
+
+def separate_enemy_columns(xs, ys, radii):
+    # separate_enemy_pairs over position columns
+    grid, cells = {}, []
+    for k, (x, y) in enumerate(zip(xs, ys)):
+        key = cell_of(x, y)
+        cells.append(key)
+        grid.setdefault(key, []).append(k)
+    
+    for i in range(len(xs)):
+        x, y = xs[i], ys[i]
+        base_reach = radii[i] + MAX_ENEMY_RADIUS
+        slack = BROADPHASE_MARGIN
+        candidates = enemy_pair_candidates(grid, i, x, y, base_reach + slack)
+        row_moved = 0.0
+        k = 0
+        while k < len(candidates):
+            j = candidates[k]
+            k += 1
+            dist = math.hypot(xs[i] - xs[j], ys[i] - ys[j])
+            min_dist = radii[i] + radii[j]
+            if dist > 0 and dist < min_dist:
+                dx = (xs[i] - xs[j]) / dist
+                dy = (ys[i] - ys[j]) / dist
+                push_amount = (min_dist - dist) * 0.51
+                xs[i] += dx * push_amount
+                ys[i] += dy * push_amount
+                xs[j] -= dx * push_amount
+                ys[j] -= dy * push_amount
+                regrid_enemy(grid, cells, j, xs[j], ys[j])
+                row_moved += push_amount
+                if row_moved > slack:
+                    slack = max(2 * slack, row_moved + BROADPHASE_MARGIN)
+                    candidates = enemy_pair_candidates(grid, j, x, y, base_reach + slack)
+                    k = 0
+
+def update_bullets_soa():
+    n = len(bullets)
+    if n == 0:
+        return
+    x, y, vx, vy = bullets.column(0), bullets.column(1), bullets.column(3), bullets.column(4)
+    kind, radius = bullets.column(6), bullets.column(7)
+    shockwave = kind == BULLET_SHOCKWAVE
+    keep = np.zeros(n, dtype=bool)
+    
+    ex, ey = enemies.column(0), enemies.column(1)
+    hp = enemies.column(4)
+    e_radius = stat_column('radius')[enemies.column(3).astype(np.intp)]
+    
+    shots = np.flatnonzero(~shockwave)
+    sx, sy, svx, svy = x[shots], y[shots], vx[shots], vy[shots]
+    blocked_t = segments_tree_t(sx, sy, sx + svx, sy + svy)
+    hit = np.zeros(len(shots), dtype=bool)
+    if len(shots) and len(ex):
+        target, hit_t = first_enemy_swept(sx, sy, svx, svy, ex, ey, e_radius)
+        hit = hit_t < blocked_t
+        damage = np.where(kind[shots] == BULLET_BURST, WEAPON_STATS[WEAPON_BURST]["damage"], WEAPON_STATS[WEAPON_NORMAL]["damage"])
+        np.subtract.at(hp, target[hit], damage[hit])
+    
+    x += vx    # shockwaves have zero velocity
+    y += vy
+    keep[shots] = (np.isinf(blocked_t) & ~hit & (-GRID_LENGTH < x[shots]) & (x[shots] < GRID_LENGTH)
+                   & (-GRID_LENGTH < y[shots]) & (y[shots] < GRID_LENGTH))
+    
+    waves = np.flatnonzero(shockwave)
+    if len(waves):
+        radius[waves] += 20
+        waves = waves[radius[waves] < 600]
+        keep[waves] = True
+        if len(ex):
+            columns = ex, ey, enemies.column(10), enemies.column(11)
+            for s in chunked(len(waves), len(ex)):
+                w = waves[s]
+                crossed = ring_crossed(columns, x[w, None], y[w, None], radius[w, None] - 20, radius[w, None])
+                hp -= crossed.sum(axis=0) * WEAPON_STATS[WEAPON_SHOCKWAVE]["damage"]
+    
+    bullets.compact(keep)
+
+def update_enemy_bullets_soa():
+    global player_hp
+    
+    n = len(enemy_bullets)
+    if n == 0:
+        return
+    x, y, vx, vy = enemy_bullets.column(0), enemy_bullets.column(1), enemy_bullets.column(3), enemy_bullets.column(4)
+    blocked_t = segments_tree_t(x, y, x + vx, y + vy)
+    hit = segments_circle_t(x, y, vx, vy, player_x, player_y, player_radius) < blocked_t
+    if hit.any():
+        player_hp -= float(enemy_bullets.column(5)[hit].sum())
+    x += vx
+    y += vy
+    keep = np.isinf(blocked_t) & ~hit & (-GRID_LENGTH < x) & (x < GRID_LENGTH) & (-GRID_LENGTH < y) & (y < GRID_LENGTH)
+    enemy_bullets.compact(keep)
+
+# PROFILER
+# Every phase adds its time to the current frame; end_profile_frame() pushes the
+# per-frame totals into a ring buffer per phase (for the P overlay) and, with
+# --profile-csv, writes them as one CSV row. A phase that did not run in a frame
+# (no sim tick, say) is left out of its buffer and written as an empty cell.
+
+PROFILE_PHASES = ('sim', 'update_game', 'update_enemies', 'resolve_collisions', 'update_bullets',
+                  'update_enemy_bullets', 'frame', 'draw_environment', 'draw_entities', 'draw_hud')
+PROFILE_WINDOW = 600    # frames kept per phase
+profile_samples = {phase: deque(maxlen=PROFILE_WINDOW) for phase in PROFILE_PHASES}
+profile_frame = {}      # phase -> seconds so far in the current frame
+profile_frames = 0
+profile_overlay = False
+profile_csv = None
+
+def profile_add(phase, start):
+    profile_frame[phase] = profile_frame.get(phase, 0.0) + time.perf_counter() - start
+
+def end_profile_frame():
+    global profile_frames
+    profile_frames += 1
+    # taken in one step: with --threaded the sim thread adds phases concurrently
+    frame = profile_frame.copy()
+    profile_frame.clear()
+    for phase, seconds in frame.items():
+        profile_samples[phase].append(seconds * 1000.0)
+    if frame_budget_ms is not None:
+        govern_frame((frame.get('sim', 0.0) + frame.get('frame', 0.0)) * 1000.0)
+    if profile_csv is not None:
+        profile_csv.writerow([profile_frames, sim_tick] +
+                             ['%.4f' % (frame[phase] * 1000.0) if phase in frame else '' for phase in PROFILE_PHASES])
+
+def open_profile_csv(path):
+    global profile_csv
+    # line buffered so the file is complete up to the last frame however the loop exits
+    profile_csv = csv.writer(open(path, 'w', newline='', buffering=1))
+    profile_csv.writerow(['frame', 'sim_tick'] + [phase + '_ms' for phase in PROFILE_PHASES])
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def draw_profile_overlay():
+    draw_text(560, 760, "%-20s %6s %6s %6s ms" % ('phase', 'p50', 'p95', 'p99'), GLUT_BITMAP_8_BY_13)
+    y = 745
+    for phase in PROFILE_PHASES:
+        ordered = sorted(profile_samples[phase])
+        if ordered:
+            draw_text(560, y, "%-20s %6.2f %6.2f %6.2f" % (phase, percentile(ordered, 0.5), percentile(ordered, 0.95),
+                                                        percentile(ordered, 0.99)), GLUT_BITMAP_8_BY_13)
+            y -= 15
+    draw_text(560, y, "GLU quadrics live: %d" % live_quadrics(), GLUT_BITMAP_8_BY_13)
+    if frame_budget_ms is not None:
+        y -= 15
+        draw_text(560, y, "governor level %d, %.2f / %.2f ms" % (governor_level, frame_cost_ms, frame_budget_ms),
+                  GLUT_BITMAP_8_BY_13)
+    for kind, (drawn, culled) in cull_counts.items():
+        y -= 15
+        draw_text(560, y, "%-20s %6d drawn %6d culled" % (kind, drawn, culled), GLUT_BITMAP_8_BY_13)
+
+# FRAME GOVERNOR
+# With --frame-budget MS, end_profile_frame() feeds each frame's sim and draw
+# time into a moving average that picks a row of GOVERNOR_LEVELS. Over budget
+# steps one level down, under GOVERNOR_HEADROOM of it one level back up, with
+# GOVERNOR_HOLD frames between steps so a level gets to show its effect first.
+# Levels drop the health bars, then shrink the projected size LOD works from,
+# then cap enemy projectiles in flight and the number of enemies spawned.
+
+GOVERNOR_LEVELS = (
+    # health bars, LOD pixel scale, enemy projectile cap, enemy cap scale
+    (True, 1.0, math.inf, 1.0),
+    (False, 1.0, math.inf, 1.0),
+    (False, 0.5, 400, 1.0),
+    (False, 0.5, 250, 0.75),
+    (False, 0.25, 150, 0.5),
+)
+GOVERNOR_SMOOTHING = 0.05   # weight of the newest frame in the average
+GOVERNOR_HEADROOM = 0.7
+GOVERNOR_HOLD = 30
+frame_budget_ms = None      # None: governor off, everything at level 0
+frame_cost_ms = 0.0
+governor_level = 0
+governor_hold = 0
+health_bars_enabled, lod_pixel_scale, enemy_projectile_cap, enemy_cap_scale = GOVERNOR_LEVELS[0]
+
+def set_governor_level(level):
+    global governor_level, health_bars_enabled, lod_pixel_scale, enemy_projectile_cap, enemy_cap_scale
+    record_input(('governor', level))
+    governor_level = level
+    health_bars_enabled, lod_pixel_scale, enemy_projectile_cap, enemy_cap_scale = GOVERNOR_LEVELS[level]
+
+def govern_frame(cost_ms):
+    global frame_cost_ms, governor_hold
+    frame_cost_ms += (cost_ms - frame_cost_ms) * GOVERNOR_SMOOTHING
+    level = governor_level
+    if governor_hold > 0:
+        governor_hold -= 1
+        return
+    if frame_cost_ms > frame_budget_ms and level < len(GOVERNOR_LEVELS) - 1:
+        level += 1
+    elif frame_cost_ms < frame_budget_ms * GOVERNOR_HEADROOM and level > 0:
+        level -= 1
+    else:
+        return
+    governor_hold = GOVERNOR_HOLD
+    # a step changes what the sim does, so it goes in like input: on a tick
+    # boundary with --threaded, and into --record recordings
+    send_input(('governor', level))
+
+# THREADED SIMULATION
+# With --threaded the tick loop runs on a worker thread and, after every tick,
+# publishes a WorldSnapshot holding its own copies of the entities and of the
+# player, booster and HUD state. showScreen draws from the latest snapshot
+# without locking: publishing is a single reference assignment and a snapshot
+# is never written by the sim once published. Keyboard and mouse input is
+# queued and applied by the sim thread before its next tick. Single-threaded,
+# showScreen draws from a WorldSnapshot that views the live state.
+
+class WorldSnapshot:
+    def __init__(self, copy):
+        if not copy:
+            self.enemies, self.bullets, self.enemy_bullets = enemies, bullets, enemy_bullets
+            self.booster = health_booster_pos
+        elif soa_backend:
+            self.enemies, self.bullets, self.enemy_bullets = enemies.copy(), bullets.copy(), enemy_bullets.copy()
+            self.booster = dict(health_booster_pos)
+        else:
+            self.enemies = [list(e) for e in enemies]
+            self.bullets = [list(b) for b in bullets]
+            self.enemy_bullets = [list(b) for b in enemy_bullets]
+            self.booster = dict(health_booster_pos)
+        self.player_x, self.player_y, self.gun_angle = player_x, player_y, gun_angle
+        self.player_hp, self.score, self.difficulty = player_hp, score, difficulty
+        self.current_weapon, self.game_state = current_weapon, game_state
+        self.laser_beam_active, self.laser_target_pos = laser_beam_active, laser_target_pos
+        self.enemy_pulse = enemy_pulse
+        self.time = time.perf_counter()
+
+sim_thread = None
+sim_stop = threading.Event()
+latest_snapshot = None      # written only by the sim thread
+frame_state = None          # what the current frame draws, set by showScreen
+input_queue = deque()       # (kind, ...) events in dispatch_input's format
+
+def select_frame_state():
+    global frame_state, render_alpha
+    if sim_thread is None:
+        frame_state = WorldSnapshot(False)
+        return
+    frame_state = latest_snapshot
+    if frame_state.game_state == GAME_PLAYING:
+        render_alpha = min(1.0, (time.perf_counter() - frame_state.time) * SIM_HZ)
+    else:
+        render_alpha = 1.0
+
+def publish_snapshot():
+    global latest_snapshot
+    latest_snapshot = WorldSnapshot(True)
+
+def simulation_loop():
+    tick_dt = 1.0 / SIM_HZ
+    next_tick = time.perf_counter()
+    while not sim_stop.is_set():
+        applied = bool(input_queue)
+        while input_queue:
+            dispatch_input(input_queue.popleft())
+        if replay_script is not None:
+            fed = replay_pos
+            feed_replay()
+            applied |= replay_pos != fed
+        
+        now = time.perf_counter()
+        if game_state != GAME_PLAYING:
+            if applied:
+                publish_snapshot()
+            time.sleep(tick_dt)
+            next_tick = time.perf_counter()
+            continue
+        if now < next_tick:
+            time.sleep(next_tick - now)
+            continue
+        
+        start = time.perf_counter()
+        simulation_tick()
+        profile_add('sim', start)
+        publish_snapshot()
+        # more than MAX_TICKS_PER_IDLE behind: slow down instead of spiralling
+        next_tick = max(next_tick + tick_dt, now - MAX_TICKS_PER_IDLE * tick_dt)
+
+def start_simulation_thread():
+    global sim_thread
+    publish_snapshot()
+    sim_thread = threading.Thread(target=simulation_loop, name='simulation', daemon=True)
+    sim_thread.start()
+
+def stop_simulation_thread():
+    # finishes the tick in progress, so the live state is whole again
+    if sim_thread is not None:
+        sim_stop.set()
+        sim_thread.join()
+
+def threaded_idle():
+    global redraw_pending
+    if latest_snapshot is not frame_state or redraw_pending or latest_snapshot.game_state == GAME_PLAYING:
+        redraw_pending = False
+        glutPostRedisplay()
+    else:
+        time.sleep(1.0 / SIM_HZ)
+
+def send_input(event):
+    if sim_thread is None:
+        dispatch_input(event)
+    else:
+        input_queue.append(event)
+
+def queue_keyboard(key, x, y):
+    request_redraw()
+    input_queue.append(('key', key))
+
+def queue_mouse(button, state, x, y):
+    request_redraw()
+    input_queue.append(('mouse', button, state))
+
 # INPUT, CAMERA & SETUP
 
 def setupCamera():
     glMatrixMode(GL_PROJECTION)
     glLoadIdentity()
-    gluPerspective(fovY, 1.25, 0.1, 4000)
+    gluPerspective(fovY, CAMERA_ASPECT, CAMERA_NEAR, CAMERA_FAR)
     glMatrixMode(GL_MODELVIEW)
     glLoadIdentity()
     
+    eye, target = camera_pose()
+    gluLookAt(*eye, *target, 0, 0, 1)
+    update_frustum(eye, target)
+
+def camera_pose():
+    state = frame_state
     if camera_mode == CAM_ORBIT:
         radius = 1200.0
         cam_z = 800.0 + camera_height_offset
         angle_rad = math.radians(camera_angle)
         cam_x = radius * math.cos(angle_rad)
         cam_y = radius * math.sin(angle_rad)
-        gluLookAt(cam_x, cam_y, cam_z, 0, 0, 40, 0, 0, 1)
+        return (cam_x, cam_y, cam_z), (0, 0, 40)
     
     elif camera_mode == CAM_TURRET_FOLLOW:
-        angle_rad = math.radians(gun_angle)
-        cam_x = player_x - 80.0 * math.cos(angle_rad)
-        cam_y = player_y - 80.0 * math.sin(angle_rad)
-        look_x = player_x + 100.0 * math.cos(angle_rad)
-        look_y = player_y + 100.0 * math.sin(angle_rad)
-        gluLookAt(cam_x, cam_y, 80.0 + camera_height_offset, look_x, look_y, 40.0, 0, 0, 1)
-    
-    elif camera_mode == CAM_FIRST_PERSON:
-        angle_rad = math.radians(gun_angle)
-        eye_x = player_x - 10 * math.cos(angle_rad)
-        eye_y = player_y - 10 * math.sin(angle_rad)
+        angle_rad = math.radians(state.gun_angle)
+        cam_x = state.player_x - 80.0 * math.cos(angle_rad)
+        cam_y = state.player_y - 80.0 * math.sin(angle_rad)
+        look_x = state.player_x + 100.0 * math.cos(angle_rad)
+        look_y = state.player_y + 100.0 * math.sin(angle_rad)
+        return (cam_x, cam_y, 80.0 + camera_height_offset), (look_x, look_y, 40.0)
+    
+    else:
+        angle_rad = math.radians(state.gun_angle)
+        eye_x = state.player_x - 10 * math.cos(angle_rad)
+        eye_y = state.player_y - 10 * math.sin(angle_rad)
         eye_z = 60.0 + camera_height_offset
-        look_x = player_x + 100 * math.cos(angle_rad)
-        look_y = player_y + 100 * math.sin(angle_rad)
+        look_x = state.player_x + 100 * math.cos(angle_rad)
+        look_y = state.player_y + 100 * math.sin(angle_rad)
         look_z = eye_z - 5
-        gluLookAt(eye_x, eye_y, eye_z, look_x, look_y, look_z, 0, 0, 1)
+        return (eye_x, eye_y, eye_z), (look_x, look_y, look_z)
 
 def keyboardListener(key, x, y):
-    global camera_mode, current_weapon, game_state, score, player_hp, difficulty
-    global player_x, player_y, gun_angle
+    global camera_mode, current_weapon, game_state, profile_overlay
     
+    request_redraw()
+    record_input(('key', key))
     if key == b' ':
         if game_state == GAME_PLAYING:
             game_state = GAME_PAUSED
@@ -983,18 +3032,7 @@ def keyboardListener(key, x, y):
             game_state = GAME_PLAYING
     
     if key == b'r' and (game_state == GAME_OVER or game_state == GAME_PAUSED):
-        game_state = GAME_PLAYING
-        score = 0
-        player_hp = PLAYER_MAX_HP
-        difficulty = 0
-        player_x, player_y, gun_angle = 0.0, -150.0, 0.0
-        enemies.clear()
-        bullets.clear()
-        enemy_bullets.clear()
-        create_scenery()
-        move_health_booster()
-        initial_spawn()
-        current_weapon = WEAPON_NORMAL
+        restart_game()
         camera_mode = CAM_TURRET_FOLLOW
     
     if game_state == GAME_PLAYING:
@@ -1017,10 +3055,14 @@ def keyboardListener(key, x, y):
         current_weapon = WEAPON_SHOCKWAVE
     if key == b'q':
         camera_mode = (camera_mode + 1) % 3
+    if key == b'p':
+        profile_overlay = not profile_overlay
 
 def specialKeyListener(key, x, y):
     global camera_angle, camera_height_offset
     
+    request_redraw()
+    record_input(('special', key))
     if key == GLUT_KEY_LEFT:
         camera_angle += 5
     if key == GLUT_KEY_RIGHT:
@@ -1033,15 +3075,48 @@ def specialKeyListener(key, x, y):
             camera_height_offset = -55
 
 def mouseListener(button, state, x, y):
+    request_redraw()
+    record_input(('mouse', button, state))
     if button == GLUT_LEFT_BUTTON:
         mouse_state[button] = state
     if state == GLUT_DOWN:
         shoot_weapon()
 
-def idle():
-    global enemy_pulse, fire_cooldown, burst_remaining
+def reset_game():
+    global game_state, score, player_hp, difficulty, player_x, player_y, gun_angle
+    global current_weapon, fire_cooldown, burst_remaining, enemy_pulse, laser_beam_active, sim_tick, opening_world
+    
+    game_state = GAME_PLAYING
+    score = 0
+    player_hp = PLAYER_MAX_HP
+    difficulty = 0
+    player_x, player_y, gun_angle = 0.0, -150.0, 0.0
+    current_weapon = WEAPON_NORMAL
+    fire_cooldown, burst_remaining = 0, 0
+    enemy_pulse, health_booster_pos['pulse'] = 0.0, 0.0
+    laser_beam_active = False
+    sim_tick = 0
+    enemies.clear()
+    bullets.clear()
+    enemy_bullets.clear()
+    create_scenery()
+    move_health_booster()
+    initial_spawn()
+    opening_world = save_world()
+
+def restart_game():
+    # back to the world reset_game (or --world) opened with, without generating it again
+    if opening_world is None:
+        reset_game()
+    else:
+        load_world(opening_world)
+
+def simulation_tick():
+    global enemy_pulse, fire_cooldown, burst_remaining, sim_tick
     
     if game_state == GAME_PLAYING:
+        sim_tick += 1
+        store_previous_positions()
         health_booster_pos['pulse'] += 0.1
         enemy_pulse += 0.12
         
@@ -1053,72 +3128,520 @@ def idle():
             angle_rad = math.radians(gun_angle)
             start_x = player_x + math.cos(angle_rad) * GUN_LENGTH
             start_y = player_y + math.sin(angle_rad) * GUN_LENGTH
-            bullets.append([start_x, start_y, 50.0, bullet_speed * math.cos(angle_rad), bullet_speed * math.sin(angle_rad), True, "burst"])
+            bullets.append([start_x, start_y, 50.0, bullet_speed * math.cos(angle_rad), bullet_speed * math.sin(angle_rad), True, BULLET_BURST])
             if burst_remaining > 0:
                 fire_cooldown = FIRE_CD_BURST
         
+        start = time.perf_counter()
         update_game()
+        profile_add('update_game', start)
+        start = time.perf_counter()
         update_bullets()
+        profile_add('update_bullets', start)
+        start = time.perf_counter()
         update_enemy_bullets()
+        profile_add('update_enemy_bullets', start)
+
+def store_previous_positions():
+    if soa_backend:
+        enemies.data[10:12, :len(enemies)] = enemies.data[0:2, :len(enemies)]
+    else:
+        for e in enemies:
+            e[10], e[11] = e[0], e[1]
+
+def request_redraw():
+    global redraw_pending
+    redraw_pending = True
+
+def idle():
+    global sim_accumulator, last_idle_time, render_alpha, redraw_pending
+    
+    now = time.perf_counter()
+    if last_idle_time is None:
+        last_idle_time = now
+    elapsed = now - last_idle_time
+    last_idle_time = now
+    tick_dt = 1.0 / SIM_HZ
+    
+    ticks = 0
+    if replay_script is not None:
+        feed_replay()
+    if game_state == GAME_PLAYING:
+        sim_accumulator += elapsed
+        while sim_accumulator >= tick_dt and ticks < MAX_TICKS_PER_IDLE:
+            if replay_script is not None:
+                feed_replay()
+                if game_state != GAME_PLAYING:
+                    break
+            start = time.perf_counter()
+            simulation_tick()
+            profile_add('sim', start)
+            sim_accumulator -= tick_dt
+            ticks += 1
+        sim_accumulator = min(sim_accumulator, tick_dt)
+        render_alpha = sim_accumulator / tick_dt
+    else:
+        sim_accumulator, render_alpha = 0.0, 1.0
     
-    glutPostRedisplay()
+    # While playing, every idle pass has a new interpolated frame to show.
+    # Paused or game-over screens only change on input, so sleep instead.
+    if ticks or redraw_pending or game_state == GAME_PLAYING:
+        redraw_pending = False
+        glutPostRedisplay()
+    else:
+        time.sleep(tick_dt)
 
 def showScreen():
+    frame_start = time.perf_counter()
+    if glyph_atlas is None:
+        init_glyph_atlas()
+    select_frame_state()
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
     glViewport(0, 0, 1000, 800)
     setupCamera()
     
     glEnable(GL_DEPTH_TEST)
     
+    start = time.perf_counter()
     draw_environment()
+    profile_add('draw_environment', start)
     draw_health_booster()
     draw_turret()
     
-    if laser_beam_active:
+    state = frame_state
+    if state.laser_beam_active:
         glColor3f(1.0, 0.2, 0.2)
         glBegin(GL_LINES)
-        angle_rad = math.radians(gun_angle)
-        gun_tip_x = player_x + math.cos(angle_rad) * GUN_LENGTH
-        gun_tip_y = player_y + math.sin(angle_rad) * GUN_LENGTH
+        angle_rad = math.radians(state.gun_angle)
+        gun_tip_x = state.player_x + math.cos(angle_rad) * GUN_LENGTH
+        gun_tip_y = state.player_y + math.sin(angle_rad) * GUN_LENGTH
         glVertex3f(gun_tip_x, gun_tip_y, 60)
-        glVertex3f(laser_target_pos[0], laser_target_pos[1], laser_target_pos[2])
+        glVertex3f(*state.laser_target_pos)
         glEnd()
     
-    for e in enemies:
-        draw_enemy(e, enemy_pulse)
-    
-    for b in bullets:
-        draw_bullet(b)
-    
-    for b in enemy_bullets:
-        draw_enemy_bullet(b)
-    
-    for e in enemies:
-        draw_enemy_health_bar(e)
+    start = time.perf_counter()
+    if instancing_enabled:
+        draw_entities_instanced()
+    else:
+        visible_enemies = [e for e in state.enemies if enemy_visible(e)]
+        visible_bullets = [b for b in state.bullets if bullet_visible(b)]
+        visible_enemy_bullets = [b for b in state.enemy_bullets if enemy_bullet_visible(b)]
+        count_culled('enemies', len(visible_enemies), len(state.enemies))
+        count_culled('projectiles', len(visible_bullets) + len(visible_enemy_bullets), len(state.bullets) + len(state.enemy_bullets))
+        
+        for e in visible_enemies:
+            draw_enemy(e, state.enemy_pulse)
+        
+        for b in visible_bullets:
+            draw_bullet(b)
+        
+        for b in visible_enemy_bullets:
+            draw_enemy_bullet(b)
+        
+        if health_bars_enabled:
+            for e in visible_enemies:
+                draw_enemy_health_bar(e)
+    profile_add('draw_entities', start)
     
     glDisable(GL_DEPTH_TEST)
+    start = time.perf_counter()
     draw_hud()
+    profile_add('draw_hud', start)
+    profile_add('frame', frame_start)
     
     glutSwapBuffers()
+    end_profile_frame()
+
+# HEADLESS
+
+def dispatch_input(event):
+    global game_state
+    kind = event[0]
+    if kind == 'key':
+        keyboardListener(event[1], 0, 0)
+    elif kind == 'special':
+        specialKeyListener(event[1], 0, 0)
+    elif kind == 'mouse':
+        mouseListener(event[1], event[2], 0, 0)
+    elif kind == 'governor':
+        set_governor_level(event[1])
+    elif kind == 'end' and game_state == GAME_PLAYING:
+        game_state = GAME_PAUSED    # where the recorded session stopped
+
+def load_input_script(path):
+    # JSON list of [tick, "key", "w"] / [tick, "special", "left"] / [tick, "mouse", "down"]
+    special_keys = {'left': GLUT_KEY_LEFT, 'right': GLUT_KEY_RIGHT, 'up': GLUT_KEY_UP, 'down': GLUT_KEY_DOWN}
+    script = {}
+    with open(path) as f:
+        for tick, kind, arg in json.load(f):
+            if kind == 'key':
+                event = ('key', arg.encode())
+            elif kind == 'special':
+                event = ('special', special_keys[arg])
+            else:
+                event = ('mouse', GLUT_LEFT_BUTTON, GLUT_DOWN if arg == 'down' else GLUT_UP)
+            script.setdefault(tick, []).append(event)
+    return script
+
+def run_headless(ticks, seed=0, input_script=None, world=None):
+    # Drives the same tick as idle() with no GL context. input_script is either
+    # {tick: [event, ...]} or a callable(tick) -> events, tick counting the
+    # ticks simulated so far; events are applied before the tick runs, like
+    # input arriving between two idle() calls. A pause only holds while the
+    # script has nothing more for its tick, so a pause and resume (or a game
+    # over and restart) given for the same tick carry on; otherwise the run
+    # stops there. world: a save_world() blob to start from instead of a new
+    # world; a paused one is resumed, one saved after game over is refused.
+    global game_state
+    random.seed(seed)
+    mouse_state[GLUT_LEFT_BUTTON] = GLUT_UP
+    if world is None:
+        reset_game()
+    else:
+        open_world(world)
+        if game_state == GAME_OVER:
+            raise ValueError("the world was saved after game over; there is nothing left to simulate")
+        game_state = GAME_PLAYING
+    
+    start = time.perf_counter()
+    tick = 0
+    while tick < ticks:
+        if input_script is not None:
+            events = input_script(tick) if callable(input_script) else input_script.get(tick, ())
+            for event in events:
+                dispatch_input(event)
+        if game_state != GAME_PLAYING:
+            break
+        headless_tick()
+        tick += 1
+    return headless_result(tick, time.perf_counter() - start)
+
+def headless_tick():
+    start = time.perf_counter()
+    simulation_tick()
+    profile_add('sim', start)
+    end_profile_frame()     # headless: one profile row per tick
+
+def headless_result(ticks, elapsed):
+    return {
+        'ticks': ticks,
+        'seconds': elapsed,
+        'ticks_per_second': ticks / elapsed if elapsed > 0 else 0.0,
+        'score': score,
+        'player_hp': player_hp,
+        'difficulty': difficulty,
+        'enemies': len(enemies),
+        'game_over': game_state == GAME_OVER,
+    }
+
+# INPUT RECORDING
+# --record PATH logs every event that reaches keyboardListener,
+# specialKeyListener or mouseListener, and every governor step, stamped with
+# sim_tick at the moment it arrives, i.e. applied before tick sim_tick + 1.
+# A header holds the seed and backend, so a replay rebuilds the same world and
+# the same ticks bit for bit. --replay PATH plays one back headless as fast as
+# it runs (with --profile-csv for per-tick timings), or with --watch in the
+# window at real time, pausing where the session was closed. Restarts reset
+# sim_tick, so events are replayed strictly in file order rather than looked
+# up by tick.
+
+RECORD_MAGIC, RECORD_VERSION = b'SSIR', 2
+RECORD_HEADER = struct.Struct('<4sHQ?')     # magic, version, seed, SoA backend
+RECORD_EVENT = struct.Struct('<IBBB')       # sim_tick, kind, two argument bytes
+RECORD_KINDS = ('key', 'special', 'mouse', 'governor', 'end')
+record_file = None
+replay_script = None    # [(tick, event)] being played back
+replay_pos = 0
+
+def start_recording(path, seed):
+    global record_file
+    # unbuffered: events are rare and the file must be complete however the window closes
+    record_file = open(path, 'wb', buffering=0)
+    record_file.write(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, seed, soa_backend))
+
+def record_input(event):
+    if record_file is None:
+        return
+    kind = event[0]
+    args = (event[1][0],) if kind == 'key' else event[1:]
+    record_file.write(RECORD_EVENT.pack(sim_tick, RECORD_KINDS.index(kind), *args, *(0,) * (2 - len(args))))
+
+def stop_recording():
+    global record_file
+    if record_file is not None:
+        # marks how far the session ran past its last input
+        record_input(('end',))
+        record_file.close()
+        record_file = None
+
+def load_recording(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < RECORD_HEADER.size:
+        raise ValueError(f"{path}: not an input recording")
+    magic, version, seed, soa = RECORD_HEADER.unpack_from(data)
+    if magic != RECORD_MAGIC or version != RECORD_VERSION:
+        raise ValueError(f"{path}: not a version {RECORD_VERSION} input recording")
+    body = data[RECORD_HEADER.size:]
+    events = []
+    # a session killed mid-write leaves a partial last event; drop it
+    for tick, kind, a, b in RECORD_EVENT.iter_unpack(body[:len(body) - len(body) % RECORD_EVENT.size]):
+        kind = RECORD_KINDS[kind]
+        if kind == 'key':
+            event = (kind, bytes((a,)))
+        elif kind == 'mouse':
+            event = (kind, a, b)
+        elif kind == 'end':
+            event = (kind,)
+        else:
+            event = (kind, a)
+        events.append((tick, event))
+    return seed, soa, events
+
+def start_replay(path):
+    global replay_script, replay_pos
+    seed, soa, replay_script = load_recording(path)
+    replay_pos = 0
+    if soa and not soa_backend:
+        enable_soa_backend()
+    elif soa_backend and not soa:
+        raise ValueError(f"{path} was recorded with the list backend; replay it without --soa")
+    random.seed(seed)
+    mouse_state[GLUT_LEFT_BUTTON] = GLUT_UP
+    set_governor_level(0)
+    reset_game()
+
+def feed_replay():
+    global replay_pos
+    while replay_pos < len(replay_script) and replay_script[replay_pos][0] == sim_tick:
+        dispatch_input(replay_script[replay_pos][1])
+        replay_pos += 1
+
+def replay_finished():
+    # out of events, or stopped (paused, game over) with the next one stamped
+    # for a tick the sim will never reach
+    if replay_pos == len(replay_script):
+        return True
+    return game_state != GAME_PLAYING and replay_script[replay_pos][0] != sim_tick
+
+def run_replay(path):
+    start_replay(path)
+    ticks = 0
+    start = time.perf_counter()
+    while True:
+        feed_replay()
+        if replay_finished():
+            break
+        if game_state == GAME_PLAYING:
+            headless_tick()
+            ticks += 1     # sim_tick restarts with the game
+    return headless_result(ticks, time.perf_counter() - start)
+
+# WORLD SNAPSHOTS
+# save_world() packs the whole world into one little-endian blob: WORLD_HEADER
+# (format, entity counts, player and game counters, booster), then enemies,
+# bullets, enemy bullets and trees as field-major float64 blocks, the SoA
+# layout, and last the flow field state as int32s (flow_state()), so a loaded
+# world steers on the same fields at the same ticks. load_world() with the SoA
+# backend adopts the blocks as the stores' storage without copying them; the
+# list backend turns them into rows. Trees are only re-indexed when they differ
+# from the current ones, so restarting into the same world is a copy and no
+# more. The random generator is not part of the world.
+
+WORLD_MAGIC, WORLD_VERSION = b'SSWD', 2
+WORLD_HEADER = struct.Struct('<4sH2x5I4x8i8d')     # 128 bytes, keeping the float64 blocks aligned
+WORLD_BLOCKS = (14, 8, 7, 3)    # fields per enemy, bullet, enemy bullet, tree
+opening_world = None            # save_world() of the world restart_game goes back to
+
+def world_columns(entities, fields):
+    if np is not None:
+        return entity_columns(entities, fields).astype('<f8').tobytes()
+    return array('d', [row[f] if f < len(row) else 0.0 for f in range(fields) for row in entities]).tobytes()
+
+def save_world():
+    trees = [list(t) for t in tree_positions]
+    counts = (len(enemies), len(bullets), len(enemy_bullets), len(trees))
+    flow = flow_state()
+    header = WORLD_HEADER.pack(WORLD_MAGIC, WORLD_VERSION, *counts, len(flow),
+                               sim_tick, score, difficulty, game_state, current_weapon, fire_cooldown,
+                               burst_remaining, laser_beam_active,
+                               player_x, player_y, gun_angle, player_hp, enemy_pulse,
+                               health_booster_pos['x'], health_booster_pos['y'], health_booster_pos['pulse'])
+    blocks = b''.join(world_columns(rows, fields) for rows, fields in zip((enemies, bullets, enemy_bullets, trees), WORLD_BLOCKS))
+    return header + blocks + struct.pack(f'<{len(flow)}i', *flow)
+
+def world_rows(block, fields, n):
+    if np is not None:
+        return block.T.tolist()
+    return [list(row) for row in zip(*(block[f * n:(f + 1) * n] for f in range(fields)))]
+
+def load_world(data):
+    # bytes are copied once; a bytearray is taken over, the SoA stores become views into it
+    global sim_tick, score, difficulty, game_state, current_weapon, fire_cooldown, burst_remaining
+    global laser_beam_active, player_x, player_y, gun_angle, player_hp, enemy_pulse
+    if not isinstance(data, bytearray):
+        data = bytearray(data)
+    if len(data) < WORLD_HEADER.size:
+        raise ValueError("not a world snapshot")
+    magic, version, *fields = WORLD_HEADER.unpack_from(data)
+    if magic != WORLD_MAGIC or version != WORLD_VERSION:
+        raise ValueError(f"not a version {WORLD_VERSION} world snapshot")
+    counts, flow_count, state = fields[:4], fields[4], fields[5:]
+    if len(data) != WORLD_HEADER.size + 8 * sum(f * n for f, n in zip(WORLD_BLOCKS, counts)) + 4 * flow_count:
+        raise ValueError("truncated world snapshot")
+    
+    blocks, offset = [], WORLD_HEADER.size
+    for f, n in zip(WORLD_BLOCKS, counts):
+        if np is not None:
+            blocks.append(np.frombuffer(data, '<f8', f * n, offset).reshape(f, n))
+        else:
+            blocks.append(memoryview(data)[offset:offset + 8 * f * n].cast('d'))
+        offset += 8 * f * n
+    
+    if soa_backend:
+        for store, block in zip((enemies, bullets, enemy_bullets), blocks):
+            store.adopt(block)
+    else:
+        enemies[:] = world_rows(blocks[0], 14, counts[0])
+        # normal and burst bullets are 7 long, shockwaves carry their radius as an 8th field
+        bullets[:] = [b if b[6] == BULLET_SHOCKWAVE else b[:7] for b in world_rows(blocks[1], 8, counts[1])]
+        enemy_bullets[:] = world_rows(blocks[2], 7, counts[2])
+    trees = [tuple(t) for t in world_rows(blocks[3], 3, counts[3])]
+    if trees != tree_positions:
+        tree_positions[:] = trees
+        index_scenery()
+    rebuild_enemy_grid()
+    
+    (sim_tick, score, difficulty, game_state, current_weapon, fire_cooldown, burst_remaining, laser_beam_active,
+     player_x, player_y, gun_angle, player_hp, enemy_pulse,
+     health_booster_pos['x'], health_booster_pos['y'], health_booster_pos['pulse']) = state
+    laser_beam_active = bool(laser_beam_active)
+    restore_flow_state(struct.unpack_from(f'<{flow_count}i', data, offset))
+
+def save_world_file(path):
+    with open(path, 'wb') as f:
+        f.write(save_world())
+
+def read_world_file(path):
+    with open(path, 'rb') as f:
+        data = bytearray(os.fstat(f.fileno()).st_size)
+        f.readinto(data)
+    return data
+
+save_world_path = None          # --save-world in the window: written by close_window
+
+def open_world(data):
+    # start on a saved world; restart_game comes back to it
+    global opening_world
+    opening_world = bytes(data)
+    load_world(data)
+
+def seed_arg(text):
+    # recordings store the seed as an unsigned 64-bit integer
+    seed = int(text)
+    if not 0 <= seed < 1 << 64:
+        raise argparse.ArgumentTypeError(f"seed must be in 0..2**64-1, got {seed}")
+    return seed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sentinel Siege 3D")
+    parser.add_argument('--soa', action='store_true', help="use the NumPy structure-of-arrays entity backend")
+    parser.add_argument('--immediate', action='store_true', help="draw models in immediate mode instead of cached VBOs")
+    parser.add_argument('--instanced', action='store_true', help="draw enemies and projectiles with instanced draw calls")
+    parser.add_argument('--threaded', action='store_true', help="run the simulation on its own thread, drawing from published snapshots")
+    parser.add_argument('--seed', type=seed_arg, help="seed the random generator for a reproducible world")
+    parser.add_argument('--headless', type=int, metavar='TICKS', help="simulate TICKS ticks without a window and report speed")
+    parser.add_argument('--script', help="JSON input script for --headless")
+    parser.add_argument('--record', metavar='PATH', help="record input and the seed to a binary file for --replay")
+    parser.add_argument('--replay', metavar='PATH', help="replay a --record file headless as fast as possible")
+    parser.add_argument('--watch', action='store_true', help="with --replay: play it in the window at real time instead")
+    parser.add_argument('--world', metavar='PATH', help="start from, and restart to, a world saved by --save-world")
+    parser.add_argument('--save-world', metavar='PATH', help="save the final world to PATH after --headless or --replay, or when the window closes")
+    parser.add_argument('--frame-budget', type=float, metavar='MS',
+                        help="trade detail, health bars and enemy counts for frame time above MS per frame (e.g. 16.6)")
+    parser.add_argument('--profile-csv', metavar='PATH', help="write per-frame phase timings (ms) to a CSV file")
+    return parser.parse_args(argv)
 
 def main():
+    global frame_budget_ms, save_world_path
+    args = parse_args()
+    if args.soa:
+        enable_soa_backend()
+    if args.profile_csv:
+        open_profile_csv(args.profile_csv)
+    if args.world and (args.record or args.replay):
+        raise SystemExit("recordings start from a generated world; --world cannot be recorded or replayed")
+    world = read_world_file(args.world) if args.world else None
+    
+    result = None
+    try:
+        if args.replay and not args.watch:
+            result = run_replay(args.replay)
+        elif args.headless is not None:
+            script = load_input_script(args.script) if args.script else None
+            result = run_headless(args.headless, args.seed or 0, script, world)
+    except ValueError as e:
+        raise SystemExit(e)
+    if result is not None:
+        print(f"{result['ticks']} ticks in {result['seconds']:.2f}s ({result['ticks_per_second']:.0f} ticks/s), "
+              f"score {result['score']}, hp {int(result['player_hp'])}" + (", game over" if result['game_over'] else ""))
+        if args.save_world:
+            save_world_file(args.save_world)
+        return
+    seed = args.seed
+    if args.record and seed is None:
+        seed = random.randrange(1 << 32)
+    if seed is not None:
+        random.seed(seed)
+    # a replay already carries the governor steps of the session it recorded
+    frame_budget_ms = None if args.replay else args.frame_budget
+    if args.save_world and not bool(glutCloseFunc):
+        raise SystemExit("--save-world in the window needs freeglut's close callback")
+    save_world_path = args.save_world
+    
     glutInit()
     glutInitDisplayMode(GLUT_DOUBLE | GLUT_RGB | GLUT_DEPTH)
     glutInitWindowSize(1000, 800)
     glutInitWindowPosition(50, 50)
     glutCreateWindow(b"Sentinel Siege 3D")
     glClearColor(0.5, 0.8, 1.0, 1.0)
-    
-    create_scenery()
-    move_health_booster()
-    initial_spawn()
+    init_mesh_cache(not args.immediate)
+    init_instancing(args.instanced)
+    
+    try:
+        if args.replay:
+            start_replay(args.replay)
+        elif world is not None:
+            open_world(world)
+        else:
+            reset_game()
+    except ValueError as e:
+        raise SystemExit(e)
+    if args.record:
+        start_recording(args.record, seed)
     
     glutDisplayFunc(showScreen)
-    glutKeyboardFunc(keyboardListener)
     glutSpecialFunc(specialKeyListener)
-    glutMouseFunc(mouseListener)
-    glutIdleFunc(idle)
+    if args.threaded:
+        start_simulation_thread()
+        keyboard, mouse = queue_keyboard, queue_mouse
+        glutIdleFunc(threaded_idle)
+    else:
+        keyboard, mouse = keyboardListener, mouseListener
+        glutIdleFunc(idle)
+    if not args.replay:     # a replay is driven by its recorded input only
+        glutKeyboardFunc(keyboard)
+        glutMouseFunc(mouse)
+    if bool(glutCloseFunc):
+        glutCloseFunc(close_window)
     glutMainLoop()
 
+def close_window():
+    stop_simulation_thread()
+    stop_recording()
+    if save_world_path is not None:
+        save_world_file(save_world_path)
+    release_gl_resources()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,193 @@
+import argparse
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import CSE423_PROJECT as game
+
+# Reproducible world states for timing the simulation without a window. Every
+# repetition starts from the same world snapshot, so a pass that kills enemies
+# or retires bullets is measured on identical input each time. --world times a
+# world saved by the game's --save-world instead of the generated scenarios.
+
+ENEMY_COUNTS = (10, 100, 1000, 10000)
+FUNCTIONS = ('update_enemies', 'resolve_collisions', 'update_bullets', 'update_enemy_bullets',
+             'handle_laser', 'check_line_of_sight', 'simulation_tick')
+LOS_SEGMENTS = 1000
+
+def build_scenario(num_enemies, seed):
+    # num_enemies enemies of every type, as many player bullets (normal and
+    # burst), half as many enemy bullets, three shockwaves at different radii
+    # and the laser held down
+    random.seed(seed)
+    game.reset_game()
+    game.enemies.clear()
+    game.sim_tick = game.AI_FAR_INTERVAL     # as if placed at tick 0, so no AI phase below reaches back before it
+    game.player_hp = 1e12       # keep the player alive so every pass does full work
+    game.current_weapon = game.WEAPON_LASER
+    game.mouse_state[game.GLUT_LEFT_BUTTON] = game.GLUT_DOWN
+
+    while len(game.enemies) < num_enemies:
+        etype = random.choices([0, 1, 2, 3, 4], weights=[10, 2, 4, 1, 8], k=1)[0]
+        stat = game.ENEMY_STATS[etype]
+        x = random.uniform(-game.GRID_LENGTH, game.GRID_LENGTH)
+        y = random.uniform(-game.GRID_LENGTH, game.GRID_LENGTH)
+        dist = math.hypot(x - game.player_x, y - game.player_y)
+        if game.is_position_valid_for_enemy_static(x, y, stat['radius']) and dist > 150:
+            # AI phases as in a running game: 1 in N of the enemies in an every-N-ticks band is due
+            last_ai = game.sim_tick - 1 - len(game.enemies) % game.ai_interval(dist)
+            game.enemies.append([x, y, 0, etype, stat['hp'], stat['hp'], stat['speed'], 0,
+                                 random.randint(0, stat['fire_rate']), 0, x, y, 0, last_ai])
+
+    for i in range(num_enemies):
+        angle = random.uniform(0, 2 * math.pi)
+        dist = random.uniform(game.GUN_LENGTH, game.GRID_LENGTH)
+        kind = game.BULLET_BURST if i % 3 == 0 else game.BULLET_NORMAL
+        game.bullets.append([game.player_x + dist * math.cos(angle), game.player_y + dist * math.sin(angle), 50.0,
+                             game.bullet_speed * math.cos(angle), game.bullet_speed * math.sin(angle), True, kind])
+    for radius in (40.0, 200.0, 400.0):
+        game.bullets.append([game.player_x, game.player_y, 0.0, 0, 0, True, game.BULLET_SHOCKWAVE, radius])
+
+    for i in range(min(len(game.enemies), max(1, num_enemies // 2))):
+        e = game.enemies[i]
+        stat = game.ENEMY_STATS[e[3]]
+        dx, dy = game.player_x - e[0], game.player_y - e[1]
+        dist = math.hypot(dx, dy)
+        game.enemy_bullets.append([e[0], e[1], 30.0, dx / dist * stat['bullet_speed'], dy / dist * stat['bullet_speed'],
+                                   stat['bullet_damage'], e[3]])
+    game.rebuild_enemy_grid()
+
+def los_segments(seed):
+    # half enemy -> player sight lines, half projectile-length steps
+    rng = random.Random(seed)
+    g = game.GRID_LENGTH
+    segments = []
+    for i in range(LOS_SEGMENTS):
+        start = (rng.uniform(-g, g), rng.uniform(-g, g))
+        if i % 2:
+            end = (game.player_x, game.player_y)
+        else:
+            angle = rng.uniform(0, 2 * math.pi)
+            end = (start[0] + 15 * math.cos(angle), start[1] + 15 * math.sin(angle))
+        segments.append((start, end))
+    return segments
+
+def restore(state):
+    game.load_world(state)
+    game.fire_cooldown = 0
+
+def run_function(name, segments):
+    if name == 'check_line_of_sight':
+        for start, end in segments:
+            game.check_line_of_sight(start, end)
+    else:
+        getattr(game, name)()
+
+def time_function(name, state, segments, min_reps, min_seconds):
+    samples = []
+    while len(samples) < min_reps or sum(samples) < min_seconds:
+        restore(state)
+        start = time.perf_counter()
+        run_function(name, segments)
+        samples.append(time.perf_counter() - start)
+        if len(samples) >= 1000:
+            break
+    return {
+        'reps': len(samples),
+        'min_ms': min(samples) * 1000.0,
+        'median_ms': statistics.median(samples) * 1000.0,
+        'mean_ms': statistics.fmean(samples) * 1000.0,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_scenario(results, scenario, seed, min_reps, min_seconds):
+    state = game.save_world()
+    segments = los_segments(seed)
+    results[scenario] = {'enemies': len(game.enemies), 'bullets': len(game.bullets), 'enemy_bullets': len(game.enemy_bullets)}
+    for name in FUNCTIONS:
+        results[scenario][name] = time_function(name, state, segments, min_reps, min_seconds)
+        print(f"{scenario:16} {name:22} {results[scenario][name]['median_ms']:10.3f} ms", flush=True)
+
+def run_benchmarks(counts, seed, min_reps, min_seconds):
+    results = {}
+    for count in counts:
+        build_scenario(count, seed)
+        run_scenario(results, 'enemies_%d' % count, seed, min_reps, min_seconds)
+    return results
+
+def run_world(path, seed, min_reps, min_seconds):
+    # the saved world as is, with the same immortal player and held laser as
+    # build_scenario, playing even if it was saved paused or after the player died
+    game.load_world(game.read_world_file(path))
+    game.game_state = game.GAME_PLAYING
+    game.player_hp = 1e12
+    game.current_weapon = game.WEAPON_LASER
+    game.mouse_state[game.GLUT_LEFT_BUTTON] = game.GLUT_DOWN
+    results = {}
+    run_scenario(results, 'world', seed, min_reps, min_seconds)
+    return results
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"\n{'scenario':16} {'function':22} {'before':>10} {'after':>10} {'speedup':>8}")
+    for scenario, timings in results.items():
+        for name in FUNCTIONS:
+            before = baseline.get(scenario, {}).get(name)
+            if before:
+                after = timings[name]['median_ms']
+                print(f"{scenario:16} {name:22} {before['median_ms']:10.3f} {after:10.3f} {before['median_ms'] / after:7.2f}x")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Sentinel Siege 3D simulation passes")
+    parser.add_argument('--enemies', default=','.join(map(str, ENEMY_COUNTS)), help="comma separated enemy counts")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--soa', action='store_true', help="benchmark the NumPy structure-of-arrays backend")
+    parser.add_argument('--min-reps', type=int, default=3)
+    parser.add_argument('--min-seconds', type=float, default=0.5, help="keep repeating a pass until it has run this long")
+    parser.add_argument('--out', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', metavar='JSON', help="earlier results to print speedups against")
+    parser.add_argument('--world', metavar='PATH', help="time a world saved with the game's --save-world")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.soa:
+        game.enable_soa_backend()
+    if args.world:
+        results = run_world(args.world, args.seed, args.min_reps, args.min_seconds)
+    else:
+        counts = [int(c) for c in args.enemies.split(',')]
+        results = run_benchmarks(counts, args.seed, args.min_reps, args.min_seconds)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'numpy': game.np.__version__ if game.np is not None else None,
+            'backend': 'soa' if args.soa else 'list',
+            'seed': args.seed,
+            'world': args.world,
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import copy
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import time
+
+import CSE423_PROJECT as game
+
+# Balance sweeps: every combination of the given stat overrides is played
+# headlessly over several seeds, by the built-in bot or an input script, across
+# a process pool. Each worker process has its own copy of the game module, and
+# every run starts from the stock stats, so runs never see each other's state.
+#
+#   python sweep.py --param ENEMY_STATS.4.speed=2,2.5,3 --param DIFFICULTY_HP_SCALE=0.1,0.15
+
+TUNABLE = ('ENEMY_STATS', 'WEAPON_STATS', 'ENEMY_KILL_SCORE', 'DIFFICULTY_HP_SCALE', 'DIFFICULTY_SPEED_SCALE',
+           'SPLIT_HP_SCALE', 'SPLIT_SPEED_SCALE', 'FIRE_CD_NORMAL', 'FIRE_CD_LASER', 'FIRE_CD_BURST',
+           'FIRE_CD_SHOCKWAVE', 'bullet_speed', 'PLAYER_MAX_HP', 'CONTACT_COOLDOWN')
+DEFAULTS = {name: copy.deepcopy(getattr(game, name)) for name in TUNABLE}
+BOT_LOW_HP = 0.35           # fraction of max hp at which the bot goes for the booster
+BOT_CROWD = (3, 300.0)      # this many enemies this close and the bot uses the shockwave
+
+# PARAMETERS
+
+def parse_key(key):
+    # "ENEMY_STATS.4.speed" -> ('ENEMY_STATS', 4, 'speed')
+    parts = tuple(int(p) if p.isdigit() else p for p in key.split('.'))
+    if parts[0] not in TUNABLE:
+        raise ValueError(f"{key}: {parts[0]} is not tunable (one of {', '.join(TUNABLE)})")
+    if 'radius' in parts:
+        # radii feed broadphase margins, flow classes and tree spacing fixed at import
+        raise ValueError(f"{key}: enemy radii cannot be swept")
+    target = DEFAULTS[parts[0]]
+    for part in parts[1:]:
+        if not isinstance(target, dict) or part not in target:
+            raise ValueError(f"{key}: no such stat")
+        target = target[part]
+    return parts
+
+def set_stat(parts, value):
+    if len(parts) == 1:
+        setattr(game, parts[0], value)
+        return
+    target = getattr(game, parts[0])
+    for part in parts[1:-1]:
+        target = target[part]
+    target[parts[-1]] = value
+
+def parse_param(text):
+    key, _, values = text.partition('=')
+    return key, [json.loads(v) for v in values.split(',')]
+
+def build_grid(params):
+    # params: [(key, [values])] -> list of {key: value}, one per combination
+    keys = [key for key, _ in params]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(values for _, values in params))]
+
+# BOT
+
+def angle_to(x, y):
+    return math.degrees(math.atan2(y - game.player_y, x - game.player_x))
+
+def turn_towards(angle):
+    diff = (angle - game.gun_angle + 180.0) % 360.0 - 180.0
+    if diff > game.TURN_STEP / 2:
+        return [('key', b'a')], diff
+    if diff < -game.TURN_STEP / 2:
+        return [('key', b'd')], diff
+    return [], diff
+
+def bot_player(tick):
+    # aims at the nearest enemy and fires once lined up, answers a crowd with
+    # the shockwave and walks to the health booster when low
+    if game.player_hp < BOT_LOW_HP * game.PLAYER_MAX_HP:
+        events, diff = turn_towards(angle_to(game.health_booster_pos['x'], game.health_booster_pos['y']))
+        if abs(diff) < 20 and tick % 3 == 0:
+            events.append(('key', b'w'))
+        return events
+
+    nearest, nearest_dist, crowd = None, math.inf, 0
+    for e in game.enemies:
+        dist = math.hypot(e[0] - game.player_x, e[1] - game.player_y)
+        crowd += dist < BOT_CROWD[1]
+        if dist < nearest_dist:
+            nearest, nearest_dist = e, dist
+    if nearest is None:
+        return []
+
+    weapon = b'4' if crowd >= BOT_CROWD[0] else b'1'
+    events, diff = turn_towards(angle_to(nearest[0], nearest[1]))
+    events.append(('key', weapon))
+    if weapon == b'4' or abs(diff) < 5:
+        events.append(('mouse', game.GLUT_LEFT_BUTTON, game.GLUT_DOWN))
+    return events
+
+# WORKERS
+
+def init_worker(soa):
+    if soa:
+        game.enable_soa_backend()
+
+def run_task(task):
+    index, overrides, seed, ticks, script = task
+    for name, value in DEFAULTS.items():
+        setattr(game, name, copy.deepcopy(value))
+    for key, value in overrides.items():
+        set_stat(parse_key(key), value)
+    return index, game.run_headless(ticks, seed, script if script is not None else bot_player)
+
+def summarize(runs):
+    ticks = sum(r['ticks'] for r in runs)
+    seconds = sum(r['seconds'] for r in runs)
+    return {
+        'runs': len(runs),
+        'survival_rate': sum(not r['game_over'] for r in runs) / len(runs),
+        'mean_survival_ticks': ticks / len(runs),
+        'mean_score': sum(r['score'] for r in runs) / len(runs),
+        'mean_difficulty': sum(r['difficulty'] for r in runs) / len(runs),
+        'ms_per_tick': seconds / ticks * 1000.0 if ticks else 0.0,
+    }
+
+def run_sweep(grid, seeds, ticks, script, jobs, soa):
+    tasks = [(i, overrides, seed, ticks, script) for i, overrides in enumerate(grid) for seed in seeds]
+    runs = [[] for _ in grid]
+    start = time.perf_counter()
+    with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(soa,)) as pool:
+        for done, (index, result) in enumerate(pool.imap_unordered(run_task, tasks), 1):
+            runs[index].append(result)
+            print(f"\r{done}/{len(tasks)} runs, {time.perf_counter() - start:.0f}s", end='', flush=True)
+    print()
+    return [summarize(r) for r in runs]
+
+def write_table(path, grid, summaries):
+    keys = list(grid[0]) if grid else []
+    columns = list(summaries[0]) if summaries else []
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(keys + columns)
+        for overrides, summary in zip(grid, summaries):
+            writer.writerow([overrides[k] for k in keys] + [round(summary[c], 4) for c in columns])
+    widths = [max(len(k), 8) for k in keys]
+    print('  '.join(k.rjust(w) for k, w in zip(keys, widths)) + '  survive  ticks    score   ms/tick')
+    for overrides, summary in zip(grid, summaries):
+        print('  '.join(str(overrides[k]).rjust(w) for k, w in zip(keys, widths)) +
+              f"  {summary['survival_rate']:7.0%} {summary['mean_survival_ticks']:6.0f} {summary['mean_score']:8.1f} {summary['ms_per_tick']:9.3f}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep Sentinel Siege 3D balance parameters headlessly")
+    parser.add_argument('--param', action='append', default=[], metavar='KEY=V1,V2',
+                        help="stat to sweep, e.g. ENEMY_STATS.4.speed=2,2.5 or WEAPON_STATS.0.damage=40,50")
+    parser.add_argument('--grid', metavar='JSON', help="file mapping stat keys to lists of values")
+    parser.add_argument('--seeds', type=int, default=4, help="runs per configuration, seeded 0..N-1")
+    parser.add_argument('--ticks', type=int, default=int(game.SIM_HZ) * 300, help="tick limit per run")
+    parser.add_argument('--script', help="JSON input script to play instead of the bot")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--soa', action='store_true', help="use the NumPy structure-of-arrays backend")
+    parser.add_argument('--out', default='sweep_results.csv', help="where to write the CSV table")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    params = []
+    if args.grid:
+        with open(args.grid) as f:
+            params.extend(json.load(f).items())
+    params.extend(parse_param(p) for p in args.param)
+    try:
+        for key, _ in params:
+            parse_key(key)
+    except ValueError as e:
+        raise SystemExit(e)
+
+    grid = build_grid(params)
+    script = game.load_input_script(args.script) if args.script else None
+    print(f"{len(grid)} configurations x {args.seeds} seeds on {args.jobs} workers")
+    summaries = run_sweep(grid, range(args.seeds), args.ticks, script, args.jobs, args.soa)
+    write_table(args.out, grid, summaries)
+    print(f"wrote {args.out}")
+
+if __name__ == "__main__":
+    main()